@@ -15,6 +15,10 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
 from sqlalchemy.orm import DeclarativeBase
 
+import metrics
+import profiler
+from metrics import TimedQueuePool
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -34,12 +38,106 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
 }
 
+# Time pool checkouts; in-memory SQLite keeps its single shared connection
+_database_url = app.config["SQLALCHEMY_DATABASE_URI"] or ""
+if ":memory:" not in _database_url and _database_url != "sqlite://":
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["poolclass"] = TimedQueuePool
+
+# Requests slower than this are logged with their costliest queries (0 disables)
+app.config["SLOW_REQUEST_MS"] = float(os.environ.get("SLOW_REQUEST_MS", 500))
+
+# Bearer token required by /metrics when set
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+
+# Opt-in stack sampling: share of requests profiled, a token that profiles
+# any request sent with it in X-Profile, the sampling period and where
+# /admin/profile/<route> saves collapsed stacks
+app.config["PROFILE_SAMPLE_RATE"] = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.0))
+app.config["PROFILE_TOKEN"] = os.environ.get("PROFILE_TOKEN")
+app.config["PROFILE_INTERVAL_MS"] = float(os.environ.get("PROFILE_INTERVAL_MS", 1.0))
+app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR")
+
+# Background refresh interval for per-segment recommendation pools (0 disables)
+app.config["SEGMENT_POOL_REFRESH_SECONDS"] = int(os.environ.get("SEGMENT_POOL_REFRESH_SECONDS", 300))
+
+# How long active health tips are cached in memory
+app.config["HEALTH_TIP_TTL_SECONDS"] = int(os.environ.get("HEALTH_TIP_TTL_SECONDS", 3600))
+
+# Random noise added to meal scores so near-equal meals rotate between calls
+app.config["RECOMMEND_SCORE_JITTER"] = float(os.environ.get("RECOMMEND_SCORE_JITTER", 0.05))
+
+# Meals recently recommended to a user that /api/recommend leaves out (0
+# disables), and how many users' recent meals each worker keeps and for how long
+app.config["RECENT_MEALS_EXCLUDED"] = int(os.environ.get("RECENT_MEALS_EXCLUDED", 21))
+app.config["RECENT_MEALS_USERS"] = int(os.environ.get("RECENT_MEALS_USERS", 10000))
+app.config["RECENT_MEALS_TTL_SECONDS"] = float(os.environ.get("RECENT_MEALS_TTL_SECONDS", 300))
+
+# Collaborative-filtering model: where `flask recsys train` publishes it,
+# how often servers look for a new version and its weight in ranking
+app.config["RECSYS_MODEL_DIR"] = os.environ.get("RECSYS_MODEL_DIR")
+app.config["RECSYS_RELOAD_SECONDS"] = float(os.environ.get("RECSYS_RELOAD_SECONDS", 30))
+app.config["RECOMMEND_CF_WEIGHT"] = float(os.environ.get("RECOMMEND_CF_WEIGHT", 0.1))
+
+# Users allowed to call the admin endpoints (comma-separated user ids)
+app.config["ADMIN_USER_IDS"] = frozenset(
+    user_id.strip() for user_id in os.environ.get("ADMIN_USER_IDS", "").split(",") if user_id.strip()
+)
+
+# Meal plans: allowed daily calorie error and the search time budget
+app.config["MEAL_PLAN_CALORIE_TOLERANCE"] = float(os.environ.get("MEAL_PLAN_CALORIE_TOLERANCE", 0.1))
+app.config["MEAL_PLAN_TIME_BUDGET_MS"] = float(os.environ.get("MEAL_PLAN_TIME_BUDGET_MS", 150))
+
+# Where the memory-mapped catalog snapshot is exported and how often
+# workers look for a snapshot published by another process
+app.config["CATALOG_SNAPSHOT_DIR"] = os.environ.get("CATALOG_SNAPSHOT_DIR")
+app.config["CATALOG_RELOAD_SECONDS"] = float(os.environ.get("CATALOG_RELOAD_SECONDS", 1.0))
+
+# How often workers check the data_versions table for other workers' writes (0 disables)
+app.config["DATA_VERSION_POLL_SECONDS"] = float(os.environ.get("DATA_VERSION_POLL_SECONDS", 1.0))
+
+# Size and lifetime of the cached users and OAuth tokens used by auth
+app.config["AUTH_CACHE_SIZE"] = int(os.environ.get("AUTH_CACHE_SIZE", 10000))
+app.config["AUTH_CACHE_TTL_SECONDS"] = float(os.environ.get("AUTH_CACHE_TTL_SECONDS", 60))
+
+# Opt-in write-behind logging of recommendation history
+app.config["HISTORY_WRITE_BEHIND"] = os.environ.get("HISTORY_WRITE_BEHIND") == "1"
+app.config["HISTORY_QUEUE_SIZE"] = int(os.environ.get("HISTORY_QUEUE_SIZE", 10000))
+app.config["HISTORY_BATCH_SIZE"] = int(os.environ.get("HISTORY_BATCH_SIZE", 500))
+app.config["HISTORY_FLUSH_SECONDS"] = float(os.environ.get("HISTORY_FLUSH_SECONDS", 1.0))
+
+# Months of meal_history kept in the database; `flask history archive` moves
+# older months to gzipped files in HISTORY_ARCHIVE_DIR (default instance/history_archive)
+app.config["HISTORY_RETENTION_MONTHS"] = int(os.environ.get("HISTORY_RETENTION_MONTHS", 12))
+app.config["HISTORY_ARCHIVE_DIR"] = os.environ.get("HISTORY_ARCHIVE_DIR")
+
+# Days of history read on the request path (home page, recently recommended meals)
+app.config["HISTORY_RECENT_DAYS"] = int(os.environ.get("HISTORY_RECENT_DAYS", 90))
+
 # Initialize database
 db = SQLAlchemy(app, model_class=Base)
 
+# Per-route latency, SQL and connection pool metrics, served at /metrics
+metrics.init_app(app, db)
+profiler.init_app(app)
+
 # Create tables
 # Need to put this in module-level to make it work with Gunicorn.
 with app.app_context():
     import models  # noqa: F401
     db.create_all()
     logging.info("Database tables created")
+
+    from schema import upgrade_schema
+    upgrade_schema()
+
+    from profiles import convert_legacy_heights
+    convert_legacy_heights()
+
+    from data_versions import ensure_versions
+    ensure_versions()
+
+    # Seed the sample catalog on first start, then export the catalog snapshot
+    from catalog_import import init_sample_data
+    from catalog import catalog_index
+    init_sample_data()
+    catalog_index.snapshot()
@@ -0,0 +1,148 @@
+import itertools
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import app, db
+from catalog import catalog_index
+from history import write_history
+from meal_payloads import encode_object, json_array, meal_payloads
+from models import User
+from nutrition import record_nutrition
+from profiles import user_profile
+from recsys import factor_store
+from scoring import MEALS_PER_DAY, rank_candidates_many, user_meal_targets
+from segment_pools import segment_pools
+from tips import tip_service
+
+# Users loaded, ranked and written per transaction
+BATCH_CHUNK_SIZE = 1000
+
+# Longest plan a batch request may ask for
+MAX_BATCH_DAYS = 28
+
+
+class BatchRequestError(ValueError):
+    """Raised for a batch recommendation request the API can't accept"""
+
+
+def clean_batch_request(data):
+    """Validate {'user_ids': [...]} or {'user_id': ..., 'days': N}
+
+    Returns the user ids and the number of days to plan.
+    """
+    if not isinstance(data, dict):
+        raise BatchRequestError('Expected a JSON object')
+    user_ids = data.get('user_ids')
+    user_id = data.get('user_id')
+    if (user_ids is None) == (user_id is None):
+        raise BatchRequestError('Provide either user_ids or user_id')
+    if user_id is not None:
+        user_ids = [user_id]
+    if not isinstance(user_ids, list) or not user_ids:
+        raise BatchRequestError('user_ids must be a non-empty list')
+    if not all(isinstance(value, str) and value for value in user_ids):
+        raise BatchRequestError('user ids must be non-empty strings')
+    days = data.get('days', 1)
+    if not isinstance(days, int) or isinstance(days, bool) or not 1 <= days <= MAX_BATCH_DAYS:
+        raise BatchRequestError(f'days must be an integer between 1 and {MAX_BATCH_DAYS}')
+    return user_ids, days
+
+
+def all_user_ids(chunk_size=BATCH_CHUNK_SIZE):
+    """Every user id in id order, fetched a chunk at a time"""
+    last_id = ''
+    while True:
+        ids = db.session.scalars(
+            db.select(User.id).where(User.id > last_id).order_by(User.id).limit(chunk_size)
+        ).all()
+        if not ids:
+            return
+        yield from ids
+        last_id = ids[-1]
+
+
+def _chunks(values, size):
+    values = iter(values)
+    while chunk := list(itertools.islice(values, size)):
+        yield chunk
+
+
+def _select_meals(snapshot, users, count):
+    """Ranked meal ids per user id, evaluating each segment's candidates once"""
+    groups = {}
+    for user in users:
+        profile = user_profile(user)
+        groups.setdefault((tuple(profile[:4]), profile.allergies), []).append(user)
+
+    jitter = app.config['RECOMMEND_SCORE_JITTER']
+    selected = {}
+    for (segment, allergies), members in groups.items():
+        candidates = snapshot.exclude_allergens(segment_pools.get(snapshot, segment), allergies)
+        if not candidates:
+            candidates = snapshot.exclude_allergens(snapshot.all_mask, allergies)
+        targets = np.stack([user_meal_targets(user) for user in members])
+        reranks = [factor_store.reranker(user.id, snapshot) for user in members]
+        ranked = rank_candidates_many(snapshot, candidates, targets, count, jitter, reranks)
+        for user, meal_ids in zip(members, ranked):
+            selected[user.id] = meal_ids
+    return selected
+
+
+def recommend_batch(user_ids, days=1, record=True, chunk_size=BATCH_CHUNK_SIZE):
+    """Yield one NDJSON line per user and day of recommendations
+
+    Users are processed ``chunk_size`` at a time: each chunk is loaded in
+    one query, grouped by segment and allergies, and its history rows are
+    written with a single bulk insert, so memory stays flat however many
+    users are requested. History rows carry the time of the run, while
+    the daily nutrition rollup counts each day's meals on the day they
+    are planned for. Unknown users get an error line.
+    """
+    snapshot = catalog_index.snapshot()
+    recommended_at = datetime.now()
+    processed = 0
+    for chunk in _chunks(user_ids, chunk_size):
+        users = {user.id: user for user in User.query.filter(User.id.in_(chunk))}
+        selected = _select_meals(snapshot, users.values(), days * MEALS_PER_DAY)
+        fragments = meal_payloads.fragment_map(
+            {meal_id for meal_ids in selected.values() for meal_id in meal_ids}
+        )
+
+        lines = []
+        history = []
+        planned = {}
+        for user_id in chunk:
+            user = users.get(user_id)
+            if user is None:
+                lines.append(encode_object({'user_id': user_id, 'error': 'Unknown user'}) + '\n')
+                continue
+            meal_ids = selected[user_id]
+            for day in range(days):
+                day_ids = meal_ids[day * MEALS_PER_DAY:(day + 1) * MEALS_PER_DAY]
+                rows = [
+                    {'user_id': user_id, 'meal_id': meal_id, 'created_at': recommended_at}
+                    for meal_id in day_ids
+                ]
+                history.extend(rows)
+                planned.setdefault(recommended_at.date() + timedelta(days=day), []).extend(rows)
+                tips = tip_service.sample(2, health_goal=user.health_goals)
+                lines.append(encode_object({
+                    'user_id': user_id,
+                    'day': day + 1,
+                    'meals': json_array(fragments[meal_id] for meal_id in day_ids if meal_id in fragments),
+                    'health_tips': [
+                        {'title': tip.title, 'content': tip.content, 'category': tip.category}
+                        for tip in tips
+                    ],
+                }) + '\n')
+
+        if record:
+            write_history(history, nutrition=False)
+            for day, rows in planned.items():
+                record_nutrition(rows, day=day)
+        db.session.commit()
+        processed += len(users)
+        yield from lines
+    logging.info("Batch recommendations for %d users over %d days", processed, days)
@@ -0,0 +1,8 @@
+"""Synthetic data generation and end-to-end benchmarks
+
+Generate a dataset, then benchmark the main routes against it:
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench generate --meals 20000 --users 2000
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench run --save bench/baselines/latest.json
+    python -m bench compare bench/baselines/before.json bench/baselines/latest.json
+"""
@@ -0,0 +1,115 @@
+import logging
+import os
+
+import click
+
+
+def _setup(database_url):
+    """Point the app at ``database_url`` before it is imported"""
+    if database_url:
+        os.environ['DATABASE_URL'] = database_url
+    if not os.environ.get('DATABASE_URL'):
+        raise click.UsageError('Set DATABASE_URL or pass --database-url')
+    # The auth blueprint refuses to load without a Repl id; benchmarks stub auth anyway
+    os.environ.setdefault('REPL_ID', 'bench')
+    os.environ.setdefault('SESSION_SECRET', 'bench')
+    import main  # noqa: F401  registers routes and CLI commands
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+@click.group()
+def bench():
+    """Synthetic data and end-to-end benchmarks"""
+
+
+@bench.command()
+@click.option('--database-url', help='Defaults to $DATABASE_URL (SQLite or PostgreSQL).')
+@click.option('--meals', default=10000, show_default=True)
+@click.option('--users', default=1000, show_default=True)
+@click.option('--history', default=50000, show_default=True)
+@click.option('--tips', default=200, show_default=True)
+@click.option('--seed', default=0, show_default=True)
+@click.option('--reset', is_flag=True, help='Drop and recreate every table first.')
+def generate(database_url, meals, users, history, tips, seed, reset):
+    """Load a deterministic synthetic dataset"""
+    _setup(database_url)
+    from app import app, db
+    from bench.synthetic import load_dataset
+    from catalog import catalog_index
+    from schema import upgrade_schema
+
+    with app.app_context():
+        if reset:
+            click.confirm(f'Drop every table in {db.engine.url!r}?', abort=True)
+            db.drop_all()
+            db.create_all()
+            upgrade_schema()
+        try:
+            counts = load_dataset(meals=meals, users=users, history=history, tips=tips, seed=seed)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        catalog_index.snapshot()
+    click.echo(', '.join(f'{count} {name}' for name, count in counts.items()))
+
+
+@bench.command()
+@click.option('--database-url', help='Defaults to $DATABASE_URL.')
+@click.option('--route', 'routes', multiple=True, help='Route to benchmark (default: all).')
+@click.option('--requests', default=200, show_default=True, help='Measured requests per route.')
+@click.option('--warmup', default=20, show_default=True)
+@click.option('--users', default=50, show_default=True, help='Synthetic users to rotate through.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--save', type=click.Path(dir_okay=False), help='Write the report as a JSON baseline.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Compare against this baseline and fail on regressions.')
+def run(database_url, routes, requests, warmup, users, seed, save, baseline):
+    """Benchmark the main routes through the Flask test client"""
+    _setup(database_url)
+    from bench.baselines import load_baseline, save_baseline
+    from bench.harness import ROUTES, run_benchmarks
+
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        raise click.UsageError(f"unknown routes: {', '.join(sorted(unknown))}")
+    try:
+        report = run_benchmarks(routes, requests=requests, warmup=warmup, users=users, seed=seed)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    click.echo(f"{'route':<14}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'errors':>8}")
+    for name, result in report['routes'].items():
+        click.echo(f"{name:<14}{result['throughput_rps']:>9}{result['p50_ms']:>10.2f}"
+                   f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                   f"{result['queries_per_request']:>9}{result['errors']:>8}")
+    if save:
+        save_baseline(report, save)
+        click.echo(f'Saved baseline to {save}')
+    if baseline:
+        _report_comparison(load_baseline(baseline), report)
+
+
+@bench.command('compare')
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False))
+@click.argument('current', type=click.Path(exists=True, dir_okay=False))
+def compare_command(baseline, current):
+    """Compare two saved baselines and fail on regressions"""
+    from bench.baselines import load_baseline
+
+    _report_comparison(load_baseline(baseline), load_baseline(current))
+
+
+def _report_comparison(baseline, current):
+    from bench.baselines import compare
+
+    rows = compare(baseline, current)
+    click.echo(f"Compared with {baseline.get('commit') or 'baseline'} ({baseline['created_at']})")
+    for name, metric, before, after, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        click.echo(f'{name:<14}{metric:<21}{before:>10}{after:>10}{change:>+9.1%}{flag}')
+    regressions = [row for row in rows if row[-1]]
+    if regressions:
+        raise click.ClickException(f'{len(regressions)} regressions')
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,39 @@
+"""Saved benchmark reports and regression checks between them"""
+import json
+import os
+
+# Relative change in these metrics, for the worse, reported as a regression
+REGRESSION_METRICS = ('p95_ms', 'throughput_rps', 'queries_per_request')
+REGRESSION_THRESHOLD = 0.10
+
+
+def save_baseline(report, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Rows of (route, metric, before, after, change, regressed) for shared routes"""
+    rows = []
+    for name, after in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_per_request'):
+            old, new = before.get(metric), after.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            # Higher throughput is better; for every other metric lower is
+            worse = -change if metric == 'throughput_rps' else change
+            regressed = metric in REGRESSION_METRICS and worse > threshold
+            rows.append((name, metric, old, new, change, regressed))
+    return rows
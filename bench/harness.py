@@ -0,0 +1,147 @@
+"""End-to-end route benchmarks through the Flask test client"""
+import random
+import subprocess
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import event, select
+
+import replit_auth
+from app import app, db
+from bench.synthetic import USER_PREFIX
+from catalog import catalog_index
+from models import User
+
+# Access token handed to Flask-Dance instead of reading the OAuth table
+STUB_TOKEN = {'access_token': 'bench', 'token_type': 'Bearer', 'expires_in': 3600}
+
+
+def _profile_form(rng):
+    return {
+        'age': str(rng.randint(18, 80)),
+        'weight': f'{rng.uniform(50, 110):.1f}',
+        'height': f'{rng.uniform(150, 195):.0f}',
+        'gender': rng.choice(('male', 'female', 'other')),
+        'activity_level': rng.choice(('sedentary', 'light', 'moderate', 'active')),
+        'health_goals': rng.choice(('weight_loss', 'maintenance', 'muscle_gain')),
+        'dietary_preferences': rng.sample(('vegetarian', 'low_carb', 'high_protein'), rng.randint(0, 2)),
+        'allergies': rng.choice(('', 'peanut', 'milk, eggs')),
+    }
+
+
+def _rating(rng, meal_ids):
+    return {'meal_id': rng.choice(meal_ids), 'rating': rng.randint(1, 5)}
+
+
+# name -> (method, path, request kwargs factory taking (rng, meal_ids))
+ROUTES = {
+    'recommend': ('POST', '/api/recommend', lambda rng, meal_ids: {}),
+    'home': ('GET', '/home', lambda rng, meal_ids: {}),
+    'profile': ('GET', '/profile', lambda rng, meal_ids: {}),
+    'profile_save': ('POST', '/profile', lambda rng, meal_ids: {'data': _profile_form(rng)}),
+    'rate_meal': ('POST', '/api/rate_meal', lambda rng, meal_ids: {'json': _rating(rng, meal_ids)}),
+}
+
+
+class QueryCounter:
+    """Counts statements sent to the database"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def stub_auth():
+    """Serve a fixed OAuth token so require_login passes without Replit"""
+    replit_auth.UserSessionStorage.get = lambda self, blueprint: STUB_TOKEN
+
+
+def logged_in_client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = user_id
+        session['_fresh'] = True
+    return client
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(latencies, queries, errors, elapsed):
+    latencies = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'queries_per_request': round(float(np.mean(queries)), 2),
+        'max_queries': int(max(queries)),
+    }
+
+
+def run_benchmarks(routes=None, requests=200, warmup=20, users=50, seed=0):
+    """Drive each route serially and report latency, throughput and SQL counts"""
+    routes = routes or list(ROUTES)
+    rng = random.Random(seed)
+    stub_auth()
+
+    with app.app_context():
+        user_ids = db.session.scalars(
+            select(User.id).where(User.id.startswith(USER_PREFIX)).order_by(User.id).limit(users)
+        ).all()
+        if not user_ids:
+            raise ValueError("No synthetic users found; run 'python -m bench generate' first")
+        snapshot = catalog_index.snapshot()
+        meal_ids = snapshot.meal_ids.tolist()
+        dataset = {
+            'meals': len(snapshot),
+            'users': db.session.query(User.id).count(),
+            'dialect': db.engine.dialect.name,
+        }
+        counter = QueryCounter()
+        event.listen(db.engine, 'before_cursor_execute', counter)
+
+    clients = [logged_in_client(user_id) for user_id in user_ids]
+    results = {}
+    try:
+        for name in routes:
+            method, path, make_kwargs = ROUTES[name]
+            latencies, queries = [], []
+            errors = 0
+            for number in range(warmup + requests):
+                client = clients[number % len(clients)]
+                kwargs = make_kwargs(rng, meal_ids)
+                counter.count = 0
+                started = time.perf_counter()
+                response = client.open(path, method=method, **kwargs)
+                latency = time.perf_counter() - started
+                if number < warmup:
+                    continue
+                latencies.append(latency)
+                queries.append(counter.count)
+                if response.status_code >= 400:
+                    errors += 1
+            results[name] = summarize(latencies, queries, errors, sum(latencies))
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', counter)
+
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'dataset': dataset,
+        'settings': {'requests': requests, 'warmup': warmup, 'users': len(user_ids), 'seed': seed},
+        'routes': results,
+    }
@@ -0,0 +1,235 @@
+"""Deterministic synthetic catalog, users and history for benchmarks"""
+import itertools
+import json
+import logging
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from app import db
+from catalog_import import import_meals, import_tips
+from history import write_history
+from ingredients import normalize_ingredient
+from models import Meal, MealRating, User
+from profiles import DIETARY_PREFERENCES, classify, dietary_mask, segment_key
+
+# Prefix of every synthetic user id, so benchmark users are easy to spot
+USER_PREFIX = 'bench-user-'
+
+# Rows per statement when loading users, history and ratings
+LOAD_BATCH_SIZE = 5000
+
+# Share of history rows the user also rated
+RATED_SHARE = 0.3
+
+# (value, weight) pairs for each categorical column
+AGE_GROUPS = (('young', 25), ('adult', 55), ('senior', 20))
+GENDERS = (('any', 60), ('male', 20), ('female', 20))
+WEIGHT_CATEGORIES = (('normal', 50), ('overweight', 30), ('underweight', 20))
+ACTIVITY_LEVELS = (('sedentary', 20), ('light', 30), ('moderate', 35), ('active', 15))
+COST_LEVELS = (('low', 35), ('medium', 45), ('high', 20))
+DIFFICULTIES = (('easy', 55), ('medium', 35), ('hard', 10))
+HEALTH_GOALS = (
+    ('weight_loss', 30), ('maintenance', 20), ('general_health', 15), ('muscle_gain', 12),
+    ('heart_health', 8), ('weight_gain', 8), ('diabetes_management', 7),
+)
+TIP_CATEGORIES = ('nutrition', 'exercise', 'wellness')
+
+# Typical calories per meal type as (mean, standard deviation)
+MEAL_TYPES = {
+    'breakfast': (400, 100),
+    'lunch': (600, 150),
+    'dinner': (700, 150),
+    'snack': (200, 60),
+}
+MEAL_TYPE_WEIGHTS = (('breakfast', 25), ('lunch', 30), ('dinner', 30), ('snack', 15))
+
+CUISINES = (
+    'Mediterranean', 'Italian', 'Mexican', 'Japanese', 'Indian', 'Thai', 'Chinese',
+    'American', 'French', 'Greek', 'Korean', 'Middle Eastern', 'Vietnamese', 'Spanish',
+)
+DISHES = ('Bowl', 'Salad', 'Soup', 'Stir Fry', 'Wrap', 'Bake', 'Skillet', 'Curry', 'Toast', 'Smoothie')
+
+# Base ingredients, most common first; qualified variants extend the vocabulary
+BASE_INGREDIENTS = (
+    'olive oil', 'garlic', 'onion', 'salt', 'black pepper', 'tomatoes', 'chicken breast', 'eggs',
+    'rice', 'lemon', 'spinach', 'milk', 'butter', 'carrots', 'bell peppers', 'broccoli',
+    'greek yogurt', 'oats', 'quinoa', 'avocado', 'chickpeas', 'lentils', 'salmon', 'tofu',
+    'whole wheat bread', 'cheddar cheese', 'soy sauce', 'ginger', 'honey', 'almonds', 'berries',
+    'banana', 'sweet potato', 'zucchini', 'mushrooms', 'kale', 'cucumber', 'feta cheese',
+    'peanut butter', 'shrimp', 'ground beef', 'black beans', 'corn', 'cilantro', 'basil',
+    'pasta', 'walnuts', 'coconut milk', 'tahini', 'cashews', 'turkey', 'cod', 'pork loin',
+)
+QUALIFIERS = ('', 'fresh ', 'roasted ', 'organic ', 'chopped ', 'smoked ')
+
+# Allergies users list on their profile, matched against ingredient names
+ALLERGIES = ('peanut', 'milk', 'eggs', 'shrimp', 'wheat', 'soy', 'almonds', 'salmon', 'cashews')
+
+
+def _pick(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights)[0]
+
+
+def ingredient_vocabulary():
+    """Ingredient names ordered from most to least common"""
+    return [qualifier + name for qualifier in QUALIFIERS for name in BASE_INGREDIENTS]
+
+
+def generate_meals(rng, count):
+    """Meal records with realistic classification, nutrient and ingredient mixes"""
+    vocabulary = ingredient_vocabulary()
+    # Zipf-like popularity: a few staples appear in most recipes
+    popularity = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    for number in range(1, count + 1):
+        meal_type = _pick(rng, MEAL_TYPE_WEIGHTS)
+        mean, spread = MEAL_TYPES[meal_type]
+        calories = max(int(rng.gauss(mean, spread)), 50)
+        protein_share = rng.uniform(0.12, 0.35)
+        fat_share = rng.uniform(0.15, 0.40)
+        carb_share = max(1 - protein_share - fat_share, 0.05)
+        ingredients = list(dict.fromkeys(rng.choices(vocabulary, cum_weights=popularity, k=rng.randint(4, 10))))
+        cuisine = rng.choice(CUISINES)
+        dish = rng.choice(DISHES)
+        yield {
+            'name': f'{cuisine} {ingredients[0].title()} {dish} {number}',
+            'description': f'{cuisine} {dish.lower()} with {", ".join(ingredients[:3])}',
+            'calories': calories,
+            'protein': round(calories * protein_share / 4, 1),
+            'carbs': round(calories * carb_share / 4, 1),
+            'fat': round(calories * fat_share / 9, 1),
+            'fiber': round(rng.uniform(1, 15), 1),
+            'age_group': _pick(rng, AGE_GROUPS),
+            'gender': _pick(rng, GENDERS),
+            'weight_category': _pick(rng, WEIGHT_CATEGORIES),
+            'activity_level': _pick(rng, ACTIVITY_LEVELS),
+            'cost_level': _pick(rng, COST_LEVELS),
+            'prep_time': rng.choice((5, 10, 15, 20, 25, 30, 45, 60, 90)),
+            'difficulty': _pick(rng, DIFFICULTIES),
+            'cuisine_type': cuisine,
+            'meal_type': meal_type,
+            'ingredients': json.dumps(ingredients),
+            'instructions': f'Prepare the {", ".join(ingredients)} and cook as a {dish.lower()}.',
+        }
+
+
+def generate_tips(rng, count):
+    goals = [goal for goal, _ in HEALTH_GOALS]
+    for number in range(1, count + 1):
+        category = rng.choice(TIP_CATEGORIES)
+        yield {
+            'title': f'{category.title()} tip {number}',
+            'content': f'Synthetic {category} advice number {number}.',
+            'category': category,
+            'target_demographic': rng.choice(['all'] * 3 + goals),
+            'is_active': rng.random() > 0.05,
+        }
+
+
+def generate_users(rng, count):
+    """User rows with profile fields and the derived recommendation columns"""
+    for number in range(1, count + 1):
+        age = rng.randint(16, 85)
+        height = round(min(max(rng.gauss(1.70, 0.10), 1.45), 2.10), 2)
+        weight = round(min(max(rng.gauss(25, 4.5), 16), 45) * height * height, 1)
+        gender = rng.choice(('male', 'female', 'other', None))
+        activity_level = _pick(rng, ACTIVITY_LEVELS)
+        allergies = rng.sample(ALLERGIES, rng.choice((0, 0, 0, 0, 1, 1, 2)))
+        preferences = rng.sample(DIETARY_PREFERENCES, rng.choice((0, 0, 1, 1, 2, 3)))
+        segment, bmi = classify(age, weight, height, gender, activity_level)
+        yield {
+            'id': f'{USER_PREFIX}{number:07d}',
+            'email': f'{USER_PREFIX}{number:07d}@example.com',
+            'first_name': 'Bench',
+            'last_name': f'User {number}',
+            'age': age,
+            'weight': weight,
+            'height': height,
+            'gender': gender,
+            'activity_level': activity_level,
+            'health_goals': _pick(rng, HEALTH_GOALS),
+            'dietary_preferences': json.dumps(preferences),
+            'allergies': json.dumps(allergies),
+            'segment_key': segment_key(segment),
+            'bmi': bmi,
+            'allergy_set': json.dumps(sorted({normalize_ingredient(allergy) for allergy in allergies})),
+            'dietary_mask': dietary_mask(preferences),
+        }
+
+
+def generate_history(rng, count, user_ids, meal_ids, days=90):
+    """History rows skewed towards active users and popular meals"""
+    now = datetime.now()
+    user_weights = list(itertools.accumulate(1 / (rank + 1) ** 0.5 for rank in range(len(user_ids))))
+    meal_weights = list(itertools.accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(meal_ids))))
+    meal_ids = rng.sample(meal_ids, len(meal_ids))
+    for _ in range(count):
+        yield {
+            'user_id': rng.choices(user_ids, cum_weights=user_weights)[0],
+            'meal_id': rng.choices(meal_ids, cum_weights=meal_weights)[0],
+            'created_at': now - timedelta(seconds=rng.uniform(0, days * 86400)),
+        }
+
+
+def _batches(rows, size=LOAD_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_dataset(meals=10000, users=1000, history=50000, tips=200, seed=0):
+    """Load a synthetic dataset into the configured database
+
+    The same ``seed`` and sizes always produce the same data. Meals and
+    tips go through the catalog importer, so the ingredient store and
+    in-memory indexes are maintained exactly as in production.
+    """
+    rng = random.Random(seed)
+    if db.session.query(User.id).filter(User.id.startswith(USER_PREFIX)).first() is not None:
+        raise ValueError('Database already holds synthetic users; reset it first')
+
+    meal_stats = import_meals(generate_meals(rng, meals))
+    tip_stats = import_tips(generate_tips(rng, tips))
+
+    user_ids = []
+    for batch in _batches(generate_users(rng, users)):
+        db.session.execute(insert(User), batch)
+        db.session.commit()
+        user_ids.extend(row['id'] for row in batch)
+
+    meal_ids = db.session.scalars(select(Meal.id).order_by(Meal.id)).all()
+    rated = {}
+    history_count = 0
+    if user_ids and meal_ids:
+        for batch in _batches(generate_history(rng, history, user_ids, list(meal_ids))):
+            write_history(batch)
+            db.session.commit()
+            history_count += len(batch)
+            for row in batch:
+                if rng.random() < RATED_SHARE:
+                    rated[(row['user_id'], row['meal_id'])] = rng.choices((1, 2, 3, 4, 5), (5, 10, 25, 35, 25))[0]
+
+    now = datetime.now()
+    ratings = (
+        {'user_id': user_id, 'meal_id': meal_id, 'rating': rating, 'created_at': now, 'updated_at': now}
+        for (user_id, meal_id), rating in rated.items()
+    )
+    for batch in _batches(ratings):
+        db.session.execute(insert(MealRating), batch)
+        db.session.commit()
+
+    counts = {
+        'meals': meal_stats['imported'],
+        'tips': tip_stats['imported'],
+        'users': len(user_ids),
+        'history': history_count,
+        'ratings': len(rated),
+    }
+    logging.info("Loaded synthetic dataset: %s", counts)
+    return counts
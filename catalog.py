@@ -0,0 +1,408 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select
+
+from app import app, db
+from data_versions import current_version, version_registry
+from ingredients import normalize_ingredient, parse_ingredients
+from models import Ingredient, Meal, meal_ingredients
+
+# Meal columns the recommender matches against the user's classification
+CLASSIFICATION_COLUMNS = ('age_group', 'gender', 'weight_category', 'activity_level')
+
+# Other meal columns kept as bitsets for filtering
+ATTRIBUTE_COLUMNS = ('meal_type', 'cost_level')
+
+# Columns stored dictionary-encoded in the snapshot
+CODED_COLUMNS = CLASSIFICATION_COLUMNS + ATTRIBUTE_COLUMNS
+
+# calories, protein, carbs, fat, fiber, in the order of the nutrients field
+NUTRIENT_COLUMNS = ('calories', 'protein', 'carbs', 'fat', 'fiber')
+
+# Bit positions set in every byte value, used to walk a bitset quickly
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+# Upper bound on memoized allergen masks per snapshot
+MAX_ALLERGEN_MASKS = 1024
+
+# Exported snapshot versions kept on disk besides the current one
+KEEP_VERSIONS = 2
+
+POINTER_FILE = 'CURRENT'
+
+
+def snapshot_dir():
+    return app.config.get('CATALOG_SNAPSHOT_DIR') or os.path.join(app.instance_path, 'catalog')
+
+
+def read_pointer(directory):
+    """Name of the published snapshot version, or None before the first export"""
+    try:
+        with open(os.path.join(directory, POINTER_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _member_mask(member):
+    """Bitset from a boolean array indexed by position"""
+    return int.from_bytes(np.packbits(member, bitorder='little').tobytes(), 'little')
+
+
+def write_snapshot(path, rows, links, data_version=None):
+    """Write the columnar files of one snapshot version to ``path``
+
+    ``rows`` are full meal rows ordered by id and ``links`` are
+    (meal_id, ingredient name) pairs, read at catalog ``data_version``.
+    Classification columns are stored as dictionary codes, ingredient
+    postings and encoded meal payloads as offsets into flat buffers.
+    """
+    from meal_payloads import dumps, meal_payload
+
+    size = len(rows)
+    dictionaries = {column: {} for column in CODED_COLUMNS}
+    coded = {column: [] for column in CODED_COLUMNS}
+    nutrients = []
+    positions = {}
+    unlinked = {}
+    payloads = []
+    for position, row in enumerate(rows):
+        positions[row.id] = position
+        nutrients.append([getattr(row, column) for column in NUTRIENT_COLUMNS])
+        for column in CODED_COLUMNS:
+            codes = dictionaries[column]
+            coded[column].append(codes.setdefault(getattr(row, column), len(codes)))
+        if row.ingredients:
+            unlinked[row.id] = row.ingredients
+        payloads.append(dumps(meal_payload(row)).encode())
+
+    meals = np.zeros(size, dtype=[
+        ('id', '<i8'),
+        ('nutrients', '<f4', (len(NUTRIENT_COLUMNS),)),
+        *((column, '<u2') for column in CODED_COLUMNS),
+    ])
+    meals['id'] = list(positions)
+    # Missing values are stored as 0
+    meals['nutrients'] = np.nan_to_num(np.array(nutrients, dtype=np.float32).reshape(size, len(NUTRIENT_COLUMNS)))
+    for column in CODED_COLUMNS:
+        meals[column] = coded[column]
+
+    postings = {}
+    for meal_id, name in links:
+        position = positions.get(meal_id)
+        if position is not None:
+            postings.setdefault(name, []).append(position)
+            unlinked.pop(meal_id, None)
+
+    # Meals not yet in the ingredient store fall back to their JSON
+    if unlinked:
+        logging.warning("%d meals have no ingredient links; "
+                        "run 'flask catalog sync-ingredients'", len(unlinked))
+        for meal_id, ingredients in unlinked.items():
+            for name in parse_ingredients(ingredients):
+                postings.setdefault(name, []).append(positions[meal_id])
+
+    ingredient_names = sorted(postings)
+    posting_offsets = np.zeros(len(ingredient_names) + 1, dtype=np.int64)
+    posting_offsets[1:] = np.cumsum([len(postings[name]) for name in ingredient_names])
+    posting_positions = np.array(
+        [position for name in ingredient_names for position in postings[name]], dtype=np.int32
+    )
+    payload_offsets = np.zeros(size + 1, dtype=np.int64)
+    payload_offsets[1:] = np.cumsum([len(payload) for payload in payloads])
+
+    nutrients = meals['nutrients']
+    os.makedirs(path)
+    np.save(os.path.join(path, 'meals.npy'), meals)
+    # Squares then values, one row per nutrient, for vectorized scoring
+    np.save(os.path.join(path, 'features.npy'), np.vstack([nutrients.T ** 2, nutrients.T]))
+    np.save(os.path.join(path, 'posting_offsets.npy'), posting_offsets)
+    np.save(os.path.join(path, 'posting_positions.npy'), posting_positions)
+    np.save(os.path.join(path, 'payload_offsets.npy'), payload_offsets)
+    np.save(os.path.join(path, 'payloads.npy'), np.frombuffer(b''.join(payloads), dtype=np.uint8))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({
+            'meals': size,
+            'data_version': data_version,
+            'dictionaries': {column: list(codes) for column, codes in dictionaries.items()},
+            'ingredients': ingredient_names,
+            'exported_at': datetime.now().isoformat(),
+        }, f)
+
+
+def publish_snapshot(directory, version):
+    """Point CURRENT at ``version`` unless a newer export got there first
+
+    Version names start with the time their export began reading the
+    database, so a slow export can't replace a fresher one. Returns
+    whether the pointer moved.
+    """
+    with open(os.path.join(directory, POINTER_FILE + '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        current = read_pointer(directory)
+        if current is not None and current >= version:
+            return False
+        pointer = os.path.join(directory, POINTER_FILE)
+        with open(pointer + '.tmp', 'w') as f:
+            f.write(version)
+        os.replace(pointer + '.tmp', pointer)
+
+        # Versions newer than the pointer may still be being written
+        versions = sorted(name for name in os.listdir(directory)
+                          if os.path.isdir(os.path.join(directory, name)) and name < version)
+        for stale in versions[:-KEEP_VERSIONS] if KEEP_VERSIONS else versions:
+            shutil.rmtree(os.path.join(directory, stale), ignore_errors=True)
+    return True
+
+
+class CatalogSnapshot:
+    """Immutable view of the meals table at one catalog version.
+
+    The columns are memory-mapped read-only from an exported snapshot, so
+    every worker shares the same pages. Meals are numbered by their
+    position in ``meal_ids`` (ordered by id). Bit ``i`` of a bitset is
+    set when the meal at position ``i`` matches; bitsets are derived from
+    the mapped columns on first use.
+    """
+
+    def __init__(self, version, path):
+        self.version = version
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self._codes = {
+            column: {value: code for code, value in enumerate(values)}
+            for column, values in meta['dictionaries'].items()
+        }
+        self._ingredients = meta['ingredients']
+        self.data_version = meta.get('data_version')
+        self._meals = np.load(os.path.join(path, 'meals.npy'), mmap_mode='r')
+        self._posting_offsets = np.load(os.path.join(path, 'posting_offsets.npy'), mmap_mode='r')
+        self._posting_positions = np.load(os.path.join(path, 'posting_positions.npy'), mmap_mode='r')
+        self._payload_offsets = np.load(os.path.join(path, 'payload_offsets.npy'), mmap_mode='r')
+        self._payloads = np.load(os.path.join(path, 'payloads.npy'), mmap_mode='r')
+        self._value_masks = {}
+        self._allergen_masks = {}
+
+        self.meal_ids = self._meals['id']
+        # calories, protein, carbs, fat, fiber per position; missing values are 0
+        self.nutrients = self._meals['nutrients']
+        self.nutrient_features = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+        self.all_mask = (1 << len(self._meals)) - 1
+
+    def __len__(self):
+        return len(self._meals)
+
+    def position(self, meal_id):
+        """Position of ``meal_id``, or None if the snapshot doesn't hold it"""
+        position = int(np.searchsorted(self.meal_ids, meal_id))
+        if position < len(self.meal_ids) and self.meal_ids[position] == meal_id:
+            return position
+        return None
+
+    def meal_id(self, position):
+        return int(self.meal_ids[position])
+
+    def payload(self, position):
+        """Encoded API payload of the meal at ``position``"""
+        start, end = self._payload_offsets[position:position + 2]
+        return self._payloads[start:end].tobytes().decode()
+
+    def _value_mask(self, column, value):
+        mask = self._value_masks.get((column, value))
+        if mask is None:
+            code = self._codes[column].get(value)
+            mask = 0 if code is None else _member_mask(self._meals[column] == code)
+            self._value_masks[(column, value)] = mask
+        return mask
+
+    def segment_mask(self, **classification):
+        """Meals matching every given classification value or 'any'"""
+        mask = self.all_mask
+        for column, value in classification.items():
+            mask &= self._value_mask(column, value) | self._value_mask(column, 'any')
+        return mask
+
+    def attribute_mask(self, column, *values):
+        """Meals whose ``column`` is any of ``values``"""
+        mask = 0
+        for value in values:
+            mask |= self._value_mask(column, value)
+        return mask
+
+    def allergen_mask(self, term):
+        """Meals with an ingredient whose name contains ``term``
+
+        The term is matched case-insensitively against the ingredient
+        vocabulary, which is far smaller than the catalog itself.
+        """
+        term = normalize_ingredient(term)
+        if not term:
+            return 0
+        mask = self._allergen_masks.get(term)
+        if mask is None:
+            offsets = self._posting_offsets
+            member = np.zeros(len(self), dtype=bool)
+            for row, name in enumerate(self._ingredients):
+                if term in name:
+                    member[self._posting_positions[offsets[row]:offsets[row + 1]]] = True
+            mask = _member_mask(member)
+            if len(self._allergen_masks) >= MAX_ALLERGEN_MASKS:
+                self._allergen_masks.clear()
+            self._allergen_masks[term] = mask
+        return mask
+
+    def exclude_allergens(self, mask, allergies):
+        """Drop meals containing any of ``allergies`` from ``mask``"""
+        for allergy in allergies:
+            mask &= ~self.allergen_mask(allergy)
+        return mask
+
+    def positions(self, mask):
+        """Positions of the set bits in ``mask``, in ascending order"""
+        if not mask:
+            return []
+        data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+        positions = []
+        for offset, byte in enumerate(data):
+            if byte:
+                base = offset * 8
+                positions.extend(base + bit for bit in _BYTE_BITS[byte])
+        return positions
+
+    def member_array(self, mask):
+        """``mask`` as a boolean NumPy array indexed by position"""
+        size = len(self)
+        data = np.frombuffer(mask.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+        return np.unpackbits(data, count=size, bitorder='little').view(bool)
+
+    def position_array(self, mask):
+        """Positions of the set bits in ``mask`` as a NumPy index array"""
+        return np.flatnonzero(self.member_array(mask))
+
+    def ids(self, mask):
+        """Meal ids for the set bits in ``mask``"""
+        return self.meal_ids[self.position_array(mask)].tolist()
+
+
+class CatalogIndex:
+    """Versioned holder of the current CatalogSnapshot.
+
+    ``invalidate()`` bumps the version; the next ``snapshot()`` call maps
+    the published snapshot if it was exported at the catalog's current
+    data version, or else exports the meals table to a new snapshot
+    version on disk and publishes it. Every CATALOG_RELOAD_SECONDS the
+    published pointer is checked too, so a snapshot exported by another
+    worker is mapped without touching the database. Readers always get a
+    complete snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._version = 0
+        self._snapshot = None
+        self._checked_at = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+    def _reload_due(self):
+        return time.monotonic() - self._checked_at >= app.config.get('CATALOG_RELOAD_SECONDS', 1.0)
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version and not self._reload_due():
+            return snapshot
+        with self._build_lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != self._version:
+                snapshot = self.rebuild()
+            elif self._reload_due():
+                snapshot = self._follow_pointer()
+        return snapshot
+
+    def _follow_pointer(self):
+        """Swap to the published snapshot if another process exported a newer one"""
+        self._checked_at = time.monotonic()
+        directory = snapshot_dir()
+        name = read_pointer(directory)
+        if name is None or name <= self._snapshot.name:
+            return self._snapshot
+        version = self._version
+        try:
+            snapshot = CatalogSnapshot(version + 1, os.path.join(directory, name))
+        except (OSError, ValueError):
+            logging.exception("Failed to load catalog snapshot %s", name)
+            return self._snapshot
+        with self._lock:
+            # A local change since then needs a fresh export instead
+            if self._version != version:
+                return self._snapshot
+            self._version += 1
+            self._snapshot = snapshot
+        logging.info("Catalog snapshot %s loaded: %d meals (version %d)", name, len(snapshot), snapshot.version)
+        return snapshot
+
+    def _published(self, version, data_version):
+        """The published snapshot, if it is at least as new as ``data_version``"""
+        name = read_pointer(snapshot_dir())
+        if name is None or data_version is None:
+            return None
+        try:
+            snapshot = CatalogSnapshot(version, os.path.join(snapshot_dir(), name))
+        except (OSError, ValueError):
+            logging.exception("Failed to load catalog snapshot %s", name)
+            return None
+        if snapshot.data_version is None or snapshot.data_version < data_version:
+            return None
+        return snapshot
+
+    def rebuild(self):
+        version = self._version
+        name = datetime.now().strftime('%Y%m%d%H%M%S%f') + f'-{os.getpid()}'
+        data_version = current_version('catalog')
+        snapshot = self._published(version, data_version)
+        if snapshot is not None:
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            logging.info("Catalog snapshot %s loaded: %d meals (version %d)", snapshot.name, len(snapshot), version)
+            return snapshot
+
+        rows = db.session.execute(select(*Meal.__table__.columns).order_by(Meal.id)).all()
+        links = db.session.query(meal_ingredients.c.meal_id, Ingredient.name).join(
+            Ingredient, Ingredient.id == meal_ingredients.c.ingredient_id
+        ).all()
+
+        directory = snapshot_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        write_snapshot(path, rows, links, data_version)
+        snapshot = CatalogSnapshot(version, path)
+        publish_snapshot(directory, name)
+        self._snapshot = snapshot
+        self._checked_at = time.monotonic()
+        logging.info("Catalog snapshot %s exported: %d meals (version %d)", name, len(snapshot), version)
+        return snapshot
+
+
+catalog_index = CatalogIndex()
+
+
+# Rebuild the index once a transaction that touched meals commits, here or in another worker
+@version_registry.on_change('catalog')
+def _invalidate_on_change(ids):
+    catalog_index.invalidate()
@@ -0,0 +1,311 @@
+import csv
+import gzip
+import json
+import logging
+import math
+
+from sqlalchemy import Boolean, Float, Integer, String
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from data_versions import bump
+from ingredients import link_meal_ingredients
+from models import HealthTip, Meal
+
+# Rows written per transaction by the importer
+IMPORT_BATCH_SIZE = 1000
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+# Sample meals with various categories
+SAMPLE_MEALS = [
+    {
+        'name': 'Mediterranean Quinoa Bowl',
+        'description': 'A nutritious bowl with quinoa, chickpeas, vegetables, and tahini dressing',
+        'calories': 420,
+        'protein': 15.0,
+        'carbs': 65.0,
+        'fat': 12.0,
+        'fiber': 8.0,
+        'age_group': 'adult',
+        'gender': 'any',
+        'weight_category': 'normal',
+        'activity_level': 'moderate',
+        'cost_level': 'medium',
+        'prep_time': 25,
+        'difficulty': 'easy',
+        'cuisine_type': 'Mediterranean',
+        'meal_type': 'lunch',
+        'ingredients': json.dumps(['quinoa', 'chickpeas', 'cucumber', 'tomatoes', 'olives', 'tahini']),
+        'instructions': 'Cook quinoa, combine with vegetables and chickpeas, dress with tahini sauce.',
+        'image_url': 'https://pixabay.com/get/gc485ff69141098792001670aa8908a669e8c41416c662a8f34401e4f3567107b4b1096d3b5e370808f42b293470c93524508e369be9382b9eac57e0ea1f3d58f_1280.jpg'
+    },
+    {
+        'name': 'Grilled Salmon with Sweet Potato',
+        'description': 'Omega-3 rich salmon with roasted sweet potato and steamed broccoli',
+        'calories': 380,
+        'protein': 25.0,
+        'carbs': 35.0,
+        'fat': 15.0,
+        'fiber': 6.0,
+        'age_group': 'adult',
+        'gender': 'any',
+        'weight_category': 'normal',
+        'activity_level': 'active',
+        'cost_level': 'high',
+        'prep_time': 30,
+        'difficulty': 'medium',
+        'cuisine_type': 'American',
+        'meal_type': 'dinner',
+        'ingredients': json.dumps(['salmon', 'sweet potato', 'broccoli', 'olive oil', 'herbs']),
+        'instructions': 'Grill salmon, roast sweet potato, steam broccoli, serve together.',
+        'image_url': 'https://pixabay.com/get/g008e64fac11596f34500b8dc58b558b4d164cff417ac1d435b00f902f314679c1c2a5e0f2ea0174ecfc3c884f56d038a6443ed0385d915895af3504c54bbf6c0_1280.jpg'
+    },
+    {
+        'name': 'Avocado Toast with Eggs',
+        'description': 'Whole grain toast topped with mashed avocado and poached eggs',
+        'calories': 320,
+        'protein': 14.0,
+        'carbs': 28.0,
+        'fat': 18.0,
+        'fiber': 10.0,
+        'age_group': 'young',
+        'gender': 'any',
+        'weight_category': 'underweight',
+        'activity_level': 'light',
+        'cost_level': 'medium',
+        'prep_time': 15,
+        'difficulty': 'easy',
+        'cuisine_type': 'Modern',
+        'meal_type': 'breakfast',
+        'ingredients': json.dumps(['whole grain bread', 'avocado', 'eggs', 'lemon', 'salt', 'pepper']),
+        'instructions': 'Toast bread, mash avocado with seasonings, poach eggs, assemble.',
+        'image_url': 'https://pixabay.com/get/g9bc1c67b627f6d7a7fe8d30af048b1b84d00854fe214b2c7f6e90adad223d3cce6a981ad03d48dee4227ffbd3b90933589c43b1d80802f423317f305f8e49d13_1280.jpg'
+    },
+    {
+        'name': 'Lentil Vegetable Soup',
+        'description': 'Hearty soup with red lentils, carrots, celery, and spices',
+        'calories': 280,
+        'protein': 18.0,
+        'carbs': 45.0,
+        'fat': 3.0,
+        'fiber': 12.0,
+        'age_group': 'senior',
+        'gender': 'any',
+        'weight_category': 'overweight',
+        'activity_level': 'sedentary',
+        'cost_level': 'low',
+        'prep_time': 45,
+        'difficulty': 'easy',
+        'cuisine_type': 'Indian',
+        'meal_type': 'dinner',
+        'ingredients': json.dumps(['red lentils', 'carrots', 'celery', 'onions', 'garlic', 'spices']),
+        'instructions': 'Sauté vegetables, add lentils and broth, simmer until tender.',
+        'image_url': 'https://pixabay.com/get/g4196686dc7f9d9dac565724fcccd6504372c00d1245a9da6f40723a60cbfb2b7c84e495555b377c13fede39219e3578c953e508daa9f12d1f086179133a17169_1280.jpg'
+    },
+    {
+        'name': 'Greek Yogurt Berry Parfait',
+        'description': 'Layered parfait with Greek yogurt, mixed berries, and granola',
+        'calories': 250,
+        'protein': 20.0,
+        'carbs': 35.0,
+        'fat': 6.0,
+        'fiber': 5.0,
+        'age_group': 'young',
+        'gender': 'female',
+        'weight_category': 'normal',
+        'activity_level': 'moderate',
+        'cost_level': 'medium',
+        'prep_time': 5,
+        'difficulty': 'easy',
+        'cuisine_type': 'Greek',
+        'meal_type': 'breakfast',
+        'ingredients': json.dumps(['Greek yogurt', 'mixed berries', 'granola', 'honey']),
+        'instructions': 'Layer yogurt, berries, and granola in a glass or bowl.',
+        'image_url': 'https://pixabay.com/get/gda5b6fcc1e5201bd24cb92571c7bb063c6c0b65e817fd4e8177df00bbc398809d7085a3c858dad01ba370e68853bfdeb84d3c25425ca87114327d6284fc64211_1280.jpg'
+    },
+    {
+        'name': 'Chicken Stir Fry',
+        'description': 'Quick and healthy stir fry with chicken breast and mixed vegetables',
+        'calories': 350,
+        'protein': 28.0,
+        'carbs': 25.0,
+        'fat': 12.0,
+        'fiber': 4.0,
+        'age_group': 'adult',
+        'gender': 'male',
+        'weight_category': 'normal',
+        'activity_level': 'active',
+        'cost_level': 'medium',
+        'prep_time': 20,
+        'difficulty': 'medium',
+        'cuisine_type': 'Asian',
+        'meal_type': 'dinner',
+        'ingredients': json.dumps(['chicken breast', 'bell peppers', 'broccoli', 'carrots', 'soy sauce', 'ginger']),
+        'instructions': 'Cut chicken and vegetables, stir fry in wok with seasonings.',
+        'image_url': 'https://pixabay.com/get/g8e6fa1b44609075f4a6ca63e098a141f95759229602d04e8f8b88962aa10203f9f9f64656f060cdb42133a2d49ccfab56f29f60821fbbd097b0441be35aeb903_1280.jpg'
+    }
+]
+
+# Sample health tips
+SAMPLE_TIPS = [
+    {
+        'title': 'Stay Hydrated',
+        'content': 'Drink at least 8 glasses of water daily to maintain optimal health and support your metabolism.',
+        'category': 'nutrition',
+        'target_demographic': 'all'
+    },
+    {
+        'title': 'Eat the Rainbow',
+        'content': 'Include colorful fruits and vegetables in your diet to ensure you get a variety of vitamins and antioxidants.',
+        'category': 'nutrition',
+        'target_demographic': 'all'
+    },
+    {
+        'title': 'Portion Control',
+        'content': 'Use smaller plates and bowls to help control portion sizes and prevent overeating.',
+        'category': 'nutrition',
+        'target_demographic': 'weight_loss'
+    }
+]
+
+
+class CatalogImportError(ValueError):
+    """Raised for a record that doesn't fit the target table"""
+
+
+def read_records(path):
+    """Stream dict records from a JSONL or CSV file, optionally gzipped"""
+    name = path[:-3] if path.endswith('.gz') else path
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as f:
+        if name.endswith('.csv'):
+            for record in csv.DictReader(f):
+                yield {key: value for key, value in record.items() if value != ''}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def clean_record(model, record):
+    """Validate ``record`` against the model's columns and coerce its values"""
+    columns = model.__table__.columns
+    unknown = set(record) - set(columns.keys())
+    if unknown:
+        raise CatalogImportError(f"unknown columns: {', '.join(sorted(unknown))}")
+
+    row = {}
+    for column in columns:
+        if column.primary_key or column.name == 'created_at':
+            continue
+        value = record.get(column.name)
+        if value is None:
+            if not column.nullable and column.default is None:
+                raise CatalogImportError(f"missing required column '{column.name}'")
+            continue
+        if column.name == 'ingredients' and not isinstance(value, str):
+            value = json.dumps(value)
+        elif column.name == 'ingredients' and not value.lstrip().startswith('['):
+            # CSV exports list ingredients separated by semicolons
+            value = json.dumps([item.strip() for item in value.split(';') if item.strip()])
+        try:
+            if isinstance(column.type, Boolean):
+                value = value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+            elif isinstance(column.type, Integer):
+                value = int(float(value))
+            elif isinstance(column.type, Float):
+                value = float(value)
+                if not math.isfinite(value):
+                    raise ValueError(value)
+            else:
+                value = str(value)
+        except (ValueError, OverflowError):
+            raise CatalogImportError(f"invalid value for '{column.name}': {value!r}")
+        if isinstance(column.type, String) and column.type.length and len(value) > column.type.length:
+            raise CatalogImportError(f"'{column.name}' longer than {column.type.length} characters")
+        row[column.name] = value
+    return row
+
+
+def upsert_batch(model, key, rows):
+    """Insert or update ``rows`` on the unique natural ``key`` column
+
+    Rows are written with INSERT ... ON CONFLICT DO UPDATE, one statement
+    per set of columns present, so columns a record leaves out keep their
+    stored value. Returns a {key: id} map covering every row in the batch.
+    """
+    key_column = getattr(model, key)
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+
+    ids = {}
+    insert = _INSERTS[db.engine.dialect.name]
+    for columns, group in groups.items():
+        statement = insert(model).values(group)
+        statement = statement.on_conflict_do_update(
+            index_elements=[key_column],
+            set_={column: statement.excluded[column] for column in columns if column != key},
+        )
+        ids.update(db.session.execute(statement.returning(key_column, model.id)).all())
+    return ids
+
+
+def import_records(model, key, records, batch_size=IMPORT_BATCH_SIZE, strict=False):
+    """Upsert a stream of records in bounded batches, one transaction per batch"""
+    stats = {'imported': 0, 'rejected': 0, 'batches': 0}
+    batch = {}
+
+    def flush():
+        rows = list(batch.values())
+        ids = upsert_batch(model, key, rows)
+        if model is Meal:
+            # Meals imported without ingredients keep their stored ones
+            link_meal_ingredients(db.session.connection(), {
+                ids[row[key]]: row['ingredients'] for row in rows if 'ingredients' in row
+            })
+        # Bulk statements bypass the ORM flush hooks, so bump the version here
+        bump(db.session, 'catalog' if model is Meal else 'tips')
+        db.session.commit()
+        stats['imported'] += len(rows)
+        stats['batches'] += 1
+        batch.clear()
+
+    for number, record in enumerate(records, 1):
+        try:
+            row = clean_record(model, record)
+        except CatalogImportError as e:
+            if strict:
+                raise CatalogImportError(f"record {number}: {e}")
+            logging.warning("Skipping record %d: %s", number, e)
+            stats['rejected'] += 1
+            continue
+        # Later records win over earlier ones with the same key
+        batch.pop(row[key], None)
+        batch[row[key]] = row
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    return stats
+
+
+def import_meals(records, **kwargs):
+    return import_records(Meal, 'name', records, **kwargs)
+
+
+def import_tips(records, **kwargs):
+    return import_records(HealthTip, 'title', records, **kwargs)
+
+
+def init_sample_data():
+    """Initialize sample meal data if database is empty"""
+    if db.session.query(Meal.id).first() is None:
+        import_meals(SAMPLE_MEALS)
+        import_tips(SAMPLE_TIPS)
+        logging.info("Seeded sample catalog")
@@ -0,0 +1,193 @@
+import os
+
+import click
+from flask.cli import AppGroup
+
+from app import app
+from batch_recommend import MAX_BATCH_DAYS, all_user_ids, recommend_batch
+from catalog_import import (
+    IMPORT_BATCH_SIZE,
+    CatalogImportError,
+    import_meals,
+    import_tips,
+    init_sample_data,
+    read_records,
+)
+from history_partitions import archive_history, partition_history
+from ingredients import backfill_meal_ingredients
+from meal_stats import reconcile_meal_stats
+from nutrition import BACKFILL_USER_CHUNK, backfill_nutrition
+from profiles import backfill_profiles
+from query_plans import check_query_plans
+from ratings import backfill_ratings
+from recsys import TRAIN_CHUNK_SIZE, train
+from schema import upgrade_schema
+
+catalog_cli = AppGroup('catalog', help='Manage the meal catalog.')
+users_cli = AppGroup('users', help='Maintain user data.')
+schema_cli = AppGroup('schema', help='Manage the database schema.')
+ratings_cli = AppGroup('ratings', help='Maintain meal ratings.')
+recsys_cli = AppGroup('recsys', help='Train and run the recommendation models.')
+history_cli = AppGroup('history', help='Partition and archive meal history.')
+
+
+@catalog_cli.command('sync-ingredients')
+def sync_ingredients_command():
+    """Rebuild the ingredient store from Meal.ingredients"""
+    count = backfill_meal_ingredients()
+    click.echo(f'Linked ingredients for {count} meals')
+
+
+
+@catalog_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--kind', type=click.Choice(['meals', 'tips']), default='meals', show_default=True)
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+@click.option('--strict', is_flag=True, help='Abort on the first invalid record.')
+def import_command(path, kind, batch_size, strict):
+    """Upsert meals or health tips from a JSONL or CSV file (optionally .gz)"""
+    importer = import_meals if kind == 'meals' else import_tips
+    try:
+        stats = importer(read_records(path), batch_size=batch_size, strict=strict)
+    except CatalogImportError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Imported {stats['imported']} {kind} in {stats['batches']} batches "
+               f"({stats['rejected']} rejected)")
+
+
+@catalog_cli.command('seed')
+def seed_command():
+    """Load the sample catalog into an empty database"""
+    init_sample_data()
+
+
+
+@users_cli.command('backfill-profiles')
+def backfill_profiles_command():
+    """Store the derived recommendation profile for every user"""
+    count = backfill_profiles()
+    click.echo(f'Backfilled {count} user profiles')
+
+
+@users_cli.command('backfill-nutrition')
+@click.option('--chunk-size', default=BACKFILL_USER_CHUNK, show_default=True,
+              help='Users re-summed per transaction.')
+def backfill_nutrition_command(chunk_size):
+    """Recompute every user's daily nutrition totals from meal_history"""
+    count = backfill_nutrition(chunk_size)
+    click.echo(f'Backfilled {count} daily nutrition rows')
+
+
+
+@schema_cli.command('upgrade')
+def upgrade_command():
+    """Add columns and indexes missing from existing tables"""
+    upgrade_schema()
+    click.echo('Schema is up to date')
+
+
+@schema_cli.command('check-plans')
+def check_plans_command():
+    """Fail if any hot query plan falls back to a sequential scan"""
+    failed = []
+    for name, (plan, scans) in check_query_plans().items():
+        click.echo(f"{name}: {'SEQUENTIAL SCAN' if scans else 'ok'}")
+        for line in plan:
+            click.echo(f'    {line}')
+        if scans:
+            failed.append(name)
+    if failed:
+        raise click.ClickException(f"sequential scans in: {', '.join(failed)}")
+
+
+
+@catalog_cli.command('reconcile-stats')
+def reconcile_stats_command():
+    """Rebuild the per-meal recommendation and rating totals from scratch"""
+    count = reconcile_meal_stats()
+    click.echo(f'Reconciled stats for {count} meals')
+
+
+
+@ratings_cli.command('backfill')
+def backfill_ratings_command():
+    """Copy ratings stored on meal_history rows into meal_ratings"""
+    count = backfill_ratings()
+    click.echo(f'Backfilled {count} ratings')
+
+
+
+@recsys_cli.command('train')
+@click.option('--factors', default=32, show_default=True)
+@click.option('--iterations', default=10, show_default=True)
+@click.option('--regularization', default=0.1, show_default=True)
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True,
+              help='Processes solving factor rows in parallel.')
+@click.option('--chunk-size', default=TRAIN_CHUNK_SIZE, show_default=True)
+def train_command(factors, iterations, regularization, workers, chunk_size):
+    """Fit the collaborative-filtering model from meal ratings"""
+    version, meta = train(factors=factors, iterations=iterations, regularization=regularization,
+                          workers=workers, chunk_size=chunk_size)
+    click.echo(f"Published model {version}: {meta['ratings']} ratings, rmse {meta['rmse']:.4f}")
+
+
+@recsys_cli.command('batch')
+@click.option('--users', 'users_file', type=click.File('r'),
+              help='File with one user id per line ("-" for stdin).')
+@click.option('--all-users', is_flag=True, help='Recommend for every user.')
+@click.option('--user', 'user_id', help='Single user to plan several days for.')
+@click.option('--days', default=1, show_default=True, type=click.IntRange(1, MAX_BATCH_DAYS))
+@click.option('--output', '-o', type=click.File('w'), default='-', show_default=True)
+@click.option('--no-history', is_flag=True, help="Don't record the recommendations.")
+def batch_command(users_file, all_users, user_id, days, output, no_history):
+    """Write recommendations for many users as NDJSON"""
+    if sum(map(bool, (users_file, all_users, user_id))) != 1:
+        raise click.UsageError('Use exactly one of --users, --all-users or --user')
+    if users_file:
+        user_ids = (line.strip() for line in users_file if line.strip())
+    elif all_users:
+        user_ids = all_user_ids()
+    else:
+        user_ids = [user_id]
+    for line in recommend_batch(user_ids, days=days, record=not no_history):
+        output.write(line)
+
+
+
+@history_cli.command('partition')
+def partition_command():
+    """Convert meal_history into a table partitioned by month (PostgreSQL)"""
+    try:
+        moved = partition_history()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if moved is None:
+        click.echo('meal_history is already partitioned')
+    else:
+        click.echo(f'Partitioned meal_history ({moved} rows moved)')
+
+
+@history_cli.command('archive')
+@click.option('--retention-months', type=click.IntRange(0), default=None,
+              help='Months kept in the database [default: HISTORY_RETENTION_MONTHS].')
+@click.option('--output', type=click.Path(file_okay=False),
+              help='Directory for the archive files [default: HISTORY_ARCHIVE_DIR].')
+def archive_command(retention_months, output):
+    """Move months of meal_history older than the retention window to gzipped files
+
+    The archived rows are deleted from the database; the files are the
+    only copy kept.
+    """
+    archived = archive_history(retention_months, output)
+    for month, count in archived.items():
+        click.echo(f'Archived {count} rows from {month}')
+    if not archived:
+        click.echo('Nothing to archive')
+
+
+app.cli.add_command(catalog_cli)
+app.cli.add_command(users_cli)
+app.cli.add_command(schema_cli)
+app.cli.add_command(ratings_cli)
+app.cli.add_command(recsys_cli)
+app.cli.add_command(history_cli)
@@ -0,0 +1,229 @@
+import logging
+import os
+import selectors
+import threading
+import time
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from models import DataVersion, HealthTip, Meal, User
+
+# Domains with a version row, and the models whose changes bump each one
+DOMAINS = {
+    'catalog': (Meal,),
+    'tips': (HealthTip,),
+}
+
+# Domains whose changes only run this worker's callbacks: users are
+# written on every login, and a shared counter would serialize those
+# writes and flush every worker's user cache. Other workers' cached
+# users expire after AUTH_CACHE_TTL_SECONDS.
+LOCAL_DOMAINS = {
+    'users': (User,),
+}
+
+# PostgreSQL channel notified when a version is bumped
+CHANNEL = 'data_versions'
+
+
+def ensure_versions():
+    """Create the version row of every domain that doesn't have one yet"""
+    existing = set(db.session.scalars(select(DataVersion.name)))
+    for name in DOMAINS:
+        if name not in existing:
+            db.session.add(DataVersion(name=name, version=0))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created them first
+        db.session.rollback()
+
+
+def current_version(name):
+    """Committed version of ``name``, or None without a version row"""
+    return db.session.scalar(select(DataVersion.version).where(DataVersion.name == name))
+
+
+def bump(session, *names, ids=None):
+    """Bump the versions of ``names`` in the session's transaction
+
+    Each domain is bumped once per transaction; the new versions become
+    visible to other workers when it commits, and this worker's
+    on_change callbacks run then. ``ids`` maps names to the ids of the
+    rows written, where known. Bulk statements bypass the flush hooks,
+    so code issuing them calls this directly.
+    """
+    changed = session.info.setdefault('data_version_ids', {})
+    for name in names:
+        written = (ids or {}).get(name)
+        if written is None:
+            changed[name] = None
+        elif changed.get(name, set()) is not None:
+            changed.setdefault(name, set()).update(written)
+
+    bumped = session.info.setdefault('data_versions', {})
+    connection = session.connection()
+    table = DataVersion.__table__
+    for name in names:
+        if name in bumped:
+            continue
+        bumped[name] = connection.execute(
+            update(table)
+            .where(table.c.name == name)
+            .values(version=table.c.version + 1, updated_at=func.now())
+            .returning(table.c.version)
+        ).scalar()
+        if connection.dialect.name == 'postgresql':
+            connection.execute(select(func.pg_notify(CHANNEL, name)))
+
+
+class VersionRegistry:
+    """Watches the data_versions table and runs callbacks when a domain changes.
+
+    Callbacks run after a commit of this process that wrote to the
+    domain, with the ids of the rows written (or None when unknown);
+    for LOCAL_DOMAINS that is the only trigger. A
+    background thread reads the (tiny) table every
+    DATA_VERSION_POLL_SECONDS, and on PostgreSQL also LISTENs for bump
+    notifications, so other workers' commits are seen at once; those
+    fire callbacks with None. Versions this process committed itself
+    don't fire them a second time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._known = {}
+        self._thread = None
+        self._pid = None
+        self.polls = 0
+        self.changes = 0
+        self.listening = False
+
+    def on_change(self, name):
+        """Decorator registering ``callback(ids)`` for changes to ``name``"""
+        def register(callback):
+            self._callbacks.setdefault(name, []).append(callback)
+            return callback
+        return register
+
+    def committed(self, name, version, ids=None):
+        """Note a version this process committed and run its callbacks
+
+        The version is only taken as known if no other worker's came in
+        between, so the poll still reports those.
+        """
+        with self._lock:
+            if version is not None and self._known.get(name) == version - 1:
+                self._known[name] = version
+        self._fire(name, ids)
+
+    def poll(self):
+        with db.engine.connect() as connection:
+            rows = connection.execute(select(DataVersion.name, DataVersion.version)).all()
+        self.polls += 1
+        for name, version in rows:
+            with self._lock:
+                known = self._known.get(name)
+                if known is not None and version <= known:
+                    continue
+                self._known[name] = version
+            # The first read only sets the baseline
+            if known is not None:
+                self.changes += 1
+                self._fire(name, None)
+
+    def _fire(self, name, ids):
+        for callback in self._callbacks.get(name, ()):
+            try:
+                callback(ids)
+            except Exception:
+                logging.exception("Data version callback for %s failed", name)
+
+    def stats(self):
+        return {'polls': self.polls, 'changes': self.changes, 'listening': self.listening}
+
+    def ensure_worker(self, app):
+        """Start the watcher once per process"""
+        interval = app.config.get('DATA_VERSION_POLL_SECONDS', 0)
+        if interval <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, args=(app, interval), name='data-versions', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, app, interval):
+        while True:
+            try:
+                with app.app_context():
+                    if db.engine.dialect.name == 'postgresql':
+                        self._listen(interval)
+                    else:
+                        self.poll()
+            except Exception:
+                logging.exception("Data version poll failed")
+            self.listening = False
+            time.sleep(interval)
+
+    def _listen(self, interval):
+        """Poll whenever a notification arrives, and at least every ``interval``"""
+        connection = db.engine.raw_connection()
+        # Keep the listening connection out of the pool for good
+        connection.detach()
+        dbapi_connection = connection.dbapi_connection
+        try:
+            dbapi_connection.autocommit = True
+            dbapi_connection.cursor().execute(f'LISTEN {CHANNEL}')
+            self.listening = True
+            selector = selectors.DefaultSelector()
+            selector.register(dbapi_connection, selectors.EVENT_READ)
+            while True:
+                self.poll()
+                if selector.select(timeout=interval):
+                    dbapi_connection.poll()
+                    dbapi_connection.notifies.clear()
+        finally:
+            connection.close()
+
+
+version_registry = VersionRegistry()
+
+
+# Bump the version of every domain a flush wrote to
+@event.listens_for(Session, 'after_flush')
+def _bump_changed_domains(session, flush_context):
+    changed = {}
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        for name, models in (*DOMAINS.items(), *LOCAL_DOMAINS.items()):
+            if isinstance(obj, models):
+                changed.setdefault(name, set()).add(obj.id)
+    shared = {name: ids for name, ids in changed.items() if name in DOMAINS}
+    if shared:
+        bump(session, *shared, ids=shared)
+    local = session.info.setdefault('data_version_ids', {})
+    for name, ids in changed.items():
+        if name in LOCAL_DOMAINS and local.get(name, set()) is not None:
+            local.setdefault(name, set()).update(ids)
+
+
+# Local caches are invalidated once the transaction is committed
+@event.listens_for(Session, 'after_commit')
+def _record_commit(session):
+    ids = session.info.pop('data_version_ids', {})
+    versions = session.info.pop('data_versions', {})
+    for name in versions.keys() | ids.keys():
+        version_registry.committed(name, versions.get(name), ids.get(name))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('data_versions', None)
+    session.info.pop('data_version_ids', None)
@@ -0,0 +1,146 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+
+from app import db
+from meal_stats import record_recommendations
+from nutrition import record_nutrition
+from models import MealHistory
+
+
+def write_history(rows, nutrition=True):
+    """Insert MealHistory rows (dicts) with a single executemany
+
+    The meals' stats and, unless ``nutrition`` is false, the users' daily
+    nutrition totals are updated alongside. The caller owns the
+    transaction and commits it.
+    """
+    if rows:
+        db.session.execute(insert(MealHistory), rows)
+        record_recommendations(rows)
+        if nutrition:
+            record_nutrition(rows)
+
+
+def record_history(rows):
+    """Persist recommendation history, write-behind when enabled"""
+    if history_writer.enabled:
+        history_writer.enqueue(rows)
+    else:
+        write_history(rows)
+        db.session.commit()
+
+
+class HistoryWriter:
+    """Bounded queue of MealHistory rows drained by a background flusher.
+
+    The flusher bulk-inserts whenever ``batch_size`` rows are waiting or
+    ``flush_seconds`` have passed, and drains the queue at interpreter exit.
+    Rows that don't fit in the queue are dropped and counted.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._queue = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.batch_size = 500
+        self.flush_seconds = 1.0
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failed = 0
+
+    def enqueue(self, rows):
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                self.dropped += 1
+            else:
+                self.enqueued += 1
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'flushed': self.flushed,
+            'batches': self.batches,
+            'failed': self.failed,
+        }
+
+    def ensure_worker(self, app):
+        """Start the flusher once per process when write-behind is configured"""
+        if not app.config.get('HISTORY_WRITE_BEHIND') or (
+            self._thread is not None and self._pid == os.getpid()
+        ):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=app.config.get('HISTORY_QUEUE_SIZE', 10000))
+            self.batch_size = app.config.get('HISTORY_BATCH_SIZE', self.batch_size)
+            self.flush_seconds = app.config.get('HISTORY_FLUSH_SECONDS', self.flush_seconds)
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(app,), name='history-writer', daemon=True
+            )
+            self._thread.start()
+            self.enabled = True
+            atexit.register(self.shutdown)
+
+    def shutdown(self, timeout=10.0):
+        """Stop accepting rows and wait for the queue to drain"""
+        if self._thread is None:
+            return
+        self.enabled = False
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self, app):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if batch:
+                with app.app_context():
+                    self._flush(batch)
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if self._stop.is_set():
+                timeout = 0
+            elif timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        try:
+            write_history(batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.failed += len(batch)
+            logging.exception("Failed to write %d meal history rows", len(batch))
+        else:
+            self.flushed += len(batch)
+            self.batches += 1
+
+
+history_writer = HistoryWriter()
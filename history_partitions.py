@@ -0,0 +1,223 @@
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func, select, text
+
+from app import app, db
+from meal_stats import archive_recommendations
+from models import MealHistory
+
+# Rows fetched per round trip while writing an archive file
+ARCHIVE_CHUNK_SIZE = 5000
+
+# Monthly partitions created ahead of the current month
+PARTITIONS_AHEAD = 3
+
+# Catches rows outside every monthly partition, so inserts keep working
+# when no upgrade or archive run has created the coming months
+DEFAULT_PARTITION = 'meal_history_default'
+
+# meal_history as a table partitioned by month of created_at; the primary
+# key has to include the partition column
+POSTGRESQL_PARTITIONED_DDL = (
+    "CREATE TABLE meal_history ("
+    "id integer NOT NULL DEFAULT nextval('meal_history_id_seq'), "
+    "user_id varchar NOT NULL REFERENCES users (id), "
+    "meal_id integer NOT NULL REFERENCES meals (id), "
+    "rating integer, "
+    "notes text, "
+    "created_at timestamp without time zone NOT NULL, "
+    "PRIMARY KEY (id, created_at)"
+    ") PARTITION BY RANGE (created_at)"
+)
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'meal_history_y{month.year}m{month.month:02d}'
+
+
+def recent_history_cutoff():
+    """Oldest created_at the request path reads history from
+
+    Bounding hot queries by time lets PostgreSQL skip every partition
+    older than the window.
+    """
+    return datetime.now() - timedelta(days=app.config.get('HISTORY_RECENT_DAYS', 90))
+
+
+def retention_cutoff(months=None):
+    """First month kept in the database; older months get archived"""
+    if months is None:
+        months = app.config.get('HISTORY_RETENTION_MONTHS', 12)
+    return add_months(month_start(date.today()), -months)
+
+
+def archive_dir():
+    return app.config.get('HISTORY_ARCHIVE_DIR') or os.path.join(app.instance_path, 'history_archive')
+
+
+def is_partitioned(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT relkind FROM pg_class WHERE relname = 'meal_history' AND relkind IN ('r', 'p')"
+    )).scalar() == 'p'
+
+
+def create_partition(connection, month):
+    """Create the partition for ``month`` unless it exists
+
+    Rows of that month already in the default partition are moved into
+    it, since PostgreSQL refuses to add a partition whose range the
+    default partition holds rows for.
+    """
+    name = partition_name(month)
+    if connection.execute(text('SELECT to_regclass(:name)'), {'name': name}).scalar() is not None:
+        return
+    bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    in_month = f"created_at >= '{month.isoformat()}' AND created_at < '{add_months(month, 1).isoformat()}'"
+    stray = connection.execute(text(f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_month})')).scalar()
+    if not stray:
+        connection.execute(text(f'CREATE TABLE {name} PARTITION OF meal_history FOR VALUES {bounds}'))
+        return
+
+    connection.execute(text(f'ALTER TABLE meal_history DETACH PARTITION {DEFAULT_PARTITION}'))
+    connection.execute(text(f'CREATE TABLE {name} PARTITION OF meal_history FOR VALUES {bounds}'))
+    moved = connection.execute(text(
+        f'INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}'
+    )).rowcount
+    connection.execute(text(f'DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}'))
+    connection.execute(text(f'ALTER TABLE meal_history ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT'))
+    logging.info("Moved %d meal_history rows from %s to %s", moved, DEFAULT_PARTITION, name)
+
+
+def create_partitions(connection, first, last):
+    """Create the default partition and the monthly partitions from ``first`` to ``last`` inclusive"""
+    connection.execute(text(f'CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF meal_history DEFAULT'))
+    month = first
+    while month <= last:
+        create_partition(connection, month)
+        month = add_months(month, 1)
+
+
+def upgrade_history_partitions(connection):
+    """Create the coming months' partitions of a partitioned meal_history"""
+    if is_partitioned(connection):
+        current = month_start(date.today())
+        create_partitions(connection, current, add_months(current, PARTITIONS_AHEAD))
+
+
+def partition_history():
+    """Convert meal_history into a partitioned table, copying its rows over
+
+    PostgreSQL only. Runs in one transaction and rewrites the whole
+    table, so run it during a quiet period. Returns the number of rows
+    moved, or None if the table already was partitioned.
+    """
+    with db.engine.begin() as connection:
+        if connection.dialect.name != 'postgresql':
+            raise ValueError('meal_history partitioning needs PostgreSQL')
+        if is_partitioned(connection):
+            return None
+
+        # Free the index and constraint names for the new table
+        for index in MealHistory.__table__.indexes:
+            connection.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+        connection.execute(text('ALTER TABLE meal_history RENAME TO meal_history_unpartitioned'))
+        connection.execute(text(
+            'ALTER TABLE meal_history_unpartitioned RENAME CONSTRAINT meal_history_pkey '
+            'TO meal_history_unpartitioned_pkey'
+        ))
+        connection.execute(text(POSTGRESQL_PARTITIONED_DDL))
+        for index in MealHistory.__table__.indexes:
+            index.create(connection)
+
+        oldest = connection.execute(text('SELECT min(created_at) FROM meal_history_unpartitioned')).scalar()
+        current = month_start(date.today())
+        create_partitions(connection, month_start(oldest) if oldest else current, add_months(current, PARTITIONS_AHEAD))
+        moved = connection.execute(text(
+            'INSERT INTO meal_history (id, user_id, meal_id, rating, notes, created_at) '
+            'SELECT id, user_id, meal_id, rating, notes, coalesce(created_at, now()) '
+            'FROM meal_history_unpartitioned'
+        )).rowcount
+        connection.execute(text('ALTER SEQUENCE meal_history_id_seq OWNED BY meal_history.id'))
+        connection.execute(text('DROP TABLE meal_history_unpartitioned'))
+    logging.info("Partitioned meal_history: %d rows moved", moved)
+    return moved
+
+
+def archive_month(month, directory):
+    """Write one month of meal_history to a gzipped JSONL file, then remove it
+
+    The file is complete on disk before any row is removed, and the
+    month's per-meal counts are kept in archived_recommendations so
+    `flask catalog reconcile-stats` still counts them. A partitioned
+    table drops the month's partition; on SQLite and unpartitioned
+    PostgreSQL tables the month's rows are DELETEd, and the archive file
+    is the only copy left. Returns the number of rows archived.
+    """
+    start, end = month, add_months(month, 1)
+    in_month = (MealHistory.created_at >= start) & (MealHistory.created_at < end)
+    path = os.path.join(directory, f'meal_history-{month:%Y-%m}.jsonl.gz')
+
+    rows = db.session.execute(
+        select(MealHistory.__table__).where(in_month).order_by(MealHistory.id)
+        .execution_options(yield_per=ARCHIVE_CHUNK_SIZE)
+    )
+    count = 0
+    with gzip.open(path + '.tmp', 'wt') as f:
+        for row in rows:
+            record = row._asdict()
+            record['created_at'] = record['created_at'].isoformat()
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            count += 1
+    os.replace(path + '.tmp', path)
+
+    archive_recommendations(in_month)
+    connection = db.session.connection()
+    name = partition_name(month)
+    if is_partitioned(connection) and connection.execute(
+        text('SELECT to_regclass(:name)'), {'name': name}
+    ).scalar() is not None:
+        connection.execute(text(f'ALTER TABLE meal_history DETACH PARTITION {name}'))
+        connection.execute(text(f'DROP TABLE {name}'))
+    # Rows of the month in the default partition, or in an unpartitioned table
+    db.session.execute(delete(MealHistory).where(in_month))
+    db.session.commit()
+    logging.info("Archived %d meal_history rows from %s to %s", count, f'{month:%Y-%m}', path)
+    return count
+
+
+def archive_history(months=None, directory=None):
+    """Archive every month of meal_history older than the retention window
+
+    Archived rows are removed from the database (see archive_month).
+    Returns {month: rows archived}. Also creates the coming months'
+    partitions, so running it monthly keeps a partitioned table ready.
+    """
+    directory = directory or archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    cutoff = retention_cutoff(months)
+
+    archived = {}
+    oldest = db.session.scalar(select(func.min(MealHistory.created_at)))
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        archived[f'{month:%Y-%m}'] = archive_month(month, directory)
+        month = add_months(month, 1)
+
+    with db.engine.begin() as connection:
+        upgrade_history_partitions(connection)
+    return archived
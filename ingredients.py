@@ -0,0 +1,110 @@
+import json
+import logging
+
+from sqlalchemy import delete, event, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from app import db
+from models import Ingredient, Meal, meal_ingredients
+
+# Meals handled per statement when relinking the ingredient store
+LINK_BATCH_SIZE = 1000
+
+
+def normalize_ingredient(name):
+    """Canonical form used for ingredient and allergy matching"""
+    return ' '.join(str(name).split()).lower()
+
+
+def parse_ingredients(ingredients_json):
+    """Normalized ingredient names from a Meal.ingredients JSON string"""
+    try:
+        names = json.loads(ingredients_json or '[]')
+    except json.JSONDecodeError:
+        return []
+    if not isinstance(names, list):
+        return []
+    normalized = (normalize_ingredient(name) for name in names)
+    return list(dict.fromkeys(name for name in normalized if name))
+
+
+def ingredient_ids(connection, names):
+    """Map ingredient names to ids, creating any that don't exist yet"""
+    ids = {}
+    names = list(names)
+    for start in range(0, len(names), LINK_BATCH_SIZE):
+        chunk = names[start:start + LINK_BATCH_SIZE]
+        ids.update(connection.execute(
+            select(Ingredient.name, Ingredient.id).where(Ingredient.name.in_(chunk))
+        ).all())
+
+    missing = [name for name in names if name not in ids]
+    if missing:
+        connection.execute(insert(Ingredient), [{'name': name} for name in missing])
+        for start in range(0, len(missing), LINK_BATCH_SIZE):
+            chunk = missing[start:start + LINK_BATCH_SIZE]
+            ids.update(connection.execute(
+                select(Ingredient.name, Ingredient.id).where(Ingredient.name.in_(chunk))
+            ).all())
+    return ids
+
+
+def link_meal_ingredients(connection, meals):
+    """Replace the ingredient links for ``meals``, a {meal_id: ingredients_json} dict"""
+    if not meals:
+        return
+    parsed = {meal_id: parse_ingredients(text) for meal_id, text in meals.items()}
+    ids = ingredient_ids(connection, {name for names in parsed.values() for name in names})
+
+    meal_ids = list(parsed)
+    for start in range(0, len(meal_ids), LINK_BATCH_SIZE):
+        connection.execute(delete(meal_ingredients).where(
+            meal_ingredients.c.meal_id.in_(meal_ids[start:start + LINK_BATCH_SIZE])
+        ))
+
+    links = [
+        {'meal_id': meal_id, 'ingredient_id': ids[name]}
+        for meal_id, names in parsed.items()
+        for name in names
+    ]
+    if links:
+        connection.execute(insert(meal_ingredients), links)
+
+
+def backfill_meal_ingredients():
+    """Rebuild the ingredient store from Meal.ingredients for the whole catalog"""
+    count = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Meal.id, Meal.ingredients).filter(
+            Meal.id > last_id
+        ).order_by(Meal.id).limit(LINK_BATCH_SIZE).all()
+        if not rows:
+            break
+        link_meal_ingredients(db.session.connection(), dict(rows))
+        db.session.commit()
+        count += len(rows)
+        last_id = rows[-1].id
+    logging.info("Linked ingredients for %d meals", count)
+    return count
+
+
+# Keep the ingredient store in step with Meal.ingredients on every ORM flush
+@event.listens_for(Session, 'after_flush')
+def _link_flushed_meals(session, flush_context):
+    changed = {}
+    removed = []
+    for obj in session.new:
+        if isinstance(obj, Meal):
+            changed[obj.id] = obj.ingredients
+    for obj in session.dirty:
+        if isinstance(obj, Meal) and inspect(obj).attrs.ingredients.history.has_changes():
+            changed[obj.id] = obj.ingredients
+    for obj in session.deleted:
+        if isinstance(obj, Meal):
+            removed.append(obj.id)
+
+    if changed:
+        link_meal_ingredients(session.connection(), changed)
+    if removed:
+        session.connection().execute(delete(meal_ingredients).where(meal_ingredients.c.meal_id.in_(removed)))
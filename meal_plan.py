@@ -0,0 +1,163 @@
+import time
+
+import numpy as np
+
+from app import app
+from scoring import best_indices, shortlist
+
+# Plan slots with their share of the day's calories
+PLAN_SLOTS = (
+    ('breakfast', 0.25),
+    ('lunch', 0.35),
+    ('dinner', 0.30),
+    ('snack', 0.10),
+)
+
+# Cost levels from cheapest; a plan capped at one level may use any cheaper one
+COST_LEVELS = ('low', 'medium', 'high')
+
+MAX_PLAN_DAYS = 14
+
+# Best-scoring meals per slot considered by the search
+PLAN_SHORTLIST = 64
+
+# Partial day plans kept after each slot
+PLAN_BEAM_WIDTH = 32
+
+# Score cost per unit of squared relative calorie error beyond the tolerance
+CALORIE_PENALTY = 20.0
+
+# Score cost of serving a meal already used earlier in the plan
+REPEAT_PENALTY = 10.0
+
+# Column of calories in the snapshot nutrient array
+CALORIES = 0
+
+
+class MealPlanError(ValueError):
+    """Raised for a meal plan request the API can't accept"""
+
+
+def clean_plan_request(data):
+    """Validate {'days': N, 'max_cost': level}, both optional"""
+    data = data or {}
+    if not isinstance(data, dict):
+        raise MealPlanError('Expected a JSON object')
+    days = data.get('days', 7)
+    if not isinstance(days, int) or isinstance(days, bool) or not 1 <= days <= MAX_PLAN_DAYS:
+        raise MealPlanError(f'days must be an integer between 1 and {MAX_PLAN_DAYS}')
+    max_cost = data.get('max_cost')
+    if max_cost is not None and max_cost not in COST_LEVELS:
+        raise MealPlanError(f"max_cost must be one of {', '.join(COST_LEVELS)}")
+    return days, max_cost
+
+
+def cost_mask(snapshot, max_cost):
+    """Meals at or below ``max_cost``; meals without a cost level always pass"""
+    if max_cost is None:
+        return snapshot.all_mask
+    allowed = COST_LEVELS[:COST_LEVELS.index(max_cost) + 1]
+    return snapshot.attribute_mask('cost_level', None, *allowed)
+
+
+def _excess(calories, target, tolerance):
+    """Squared relative calorie error beyond ``tolerance``"""
+    error = np.maximum(np.abs(calories / target - 1) - tolerance, 0)
+    return error * error
+
+
+class SlotCandidates:
+    """Shortlisted meals for one plan slot"""
+
+    def __init__(self, name, share, positions, scores, calories):
+        self.name = name
+        self.share = share
+        self.positions = positions
+        self.scores = scores.astype(np.float32)
+        self.calories = calories
+
+
+def slot_candidates(snapshot, candidates, daily_targets, rerank=None):
+    """Per-slot shortlists of ``candidates``, each scored against its share of the day"""
+    slots = []
+    for name, share in PLAN_SLOTS:
+        mask = candidates & snapshot.attribute_mask('meal_type', name)
+        if not mask:
+            continue
+        positions, scores = shortlist(snapshot, mask, daily_targets * share, PLAN_SHORTLIST)
+        if rerank is not None:
+            scores = scores + rerank(positions)
+        slots.append((name, share, positions, scores))
+
+    # Slots missing from the catalog hand their calories to the others
+    total = sum(share for _, share, _, _ in slots)
+    return [
+        SlotCandidates(name, share / total, positions, scores, snapshot.nutrients[positions, CALORIES])
+        for name, share, positions, scores in slots
+    ]
+
+
+def _plan_day(slots, calorie_target, tolerance, beam_width):
+    """Best pick per slot for one day, by beam search over the slot shortlists"""
+    choices = np.zeros((1, 0), dtype=np.intp)
+    scores = np.zeros(1, dtype=np.float32)
+    calories = np.zeros(1, dtype=np.float32)
+    planned_share = 0.0
+    for slot in slots:
+        planned_share += slot.share
+        total_scores = (scores[:, None] + slot.scores[None, :]).ravel()
+        total_calories = (calories[:, None] + slot.calories[None, :]).ravel()
+        objective = total_scores - CALORIE_PENALTY * _excess(
+            total_calories, calorie_target * planned_share, tolerance
+        )
+        keep = best_indices(objective, beam_width)
+        rows, columns = np.divmod(keep, len(slot.scores))
+        choices = np.column_stack([choices[rows], columns])
+        scores = total_scores[keep]
+        calories = total_calories[keep]
+    best = int(np.argmax(scores - CALORIE_PENALTY * _excess(calories, calorie_target, tolerance)))
+    return choices[best]
+
+
+def _greedy_day(slots):
+    return np.array([int(np.argmax(slot.scores)) for slot in slots], dtype=np.intp)
+
+
+def plan_meals(snapshot, candidates, daily_targets, days, rerank=None,
+               tolerance=None, time_budget=None, beam_width=PLAN_BEAM_WIDTH):
+    """Pick one meal per slot from ``candidates`` for each of ``days`` days
+
+    Each day is a beam search over the slot shortlists that favours
+    well-scored meals and a calorie total within ``tolerance`` of the
+    target; meals already in the plan are penalized so they only repeat
+    when a slot runs out of alternatives. Once ``time_budget`` seconds
+    have passed the remaining days take the best remaining meal per slot,
+    so a plan always comes back on time.
+
+    Returns (days of [(slot name, position)], whether every day was searched).
+    """
+    if tolerance is None:
+        tolerance = app.config.get('MEAL_PLAN_CALORIE_TOLERANCE', 0.1)
+    if time_budget is None:
+        time_budget = app.config.get('MEAL_PLAN_TIME_BUDGET_MS', 150) / 1000
+    deadline = time.perf_counter() + time_budget
+    calorie_target = max(float(daily_targets[CALORIES]), 1.0)
+
+    slots = slot_candidates(snapshot, candidates, daily_targets, rerank)
+    plan = []
+    searched = True
+    for _ in range(days):
+        if not slots:
+            plan.append([])
+            continue
+        if searched and time.perf_counter() < deadline:
+            picks = _plan_day(slots, calorie_target, tolerance, beam_width)
+        else:
+            searched = False
+            picks = _greedy_day(slots)
+        day = []
+        for slot, pick in zip(slots, picks):
+            slot.scores[pick] -= REPEAT_PENALTY
+            day.append((slot.name, int(slot.positions[pick])))
+        plan.append(day)
+    return plan, searched
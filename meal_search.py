@@ -0,0 +1,187 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+from sqlalchemy import func, literal_column, select, text, tuple_
+
+from app import db
+from meal_payloads import dumps, meal_payload
+from models import Meal
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Meals fetched per round trip by the NDJSON export
+EXPORT_PAGE_SIZE = 1000
+
+# Longest search string accepted
+MAX_QUERY_LENGTH = 200
+
+# Columns filtered by exact value; several values may be given comma-separated
+FILTER_COLUMNS = ('meal_type', 'cuisine_type', 'difficulty', 'cost_level')
+
+# Columns filtered by min_<column> / max_<column> ranges
+RANGE_COLUMNS = ('calories', 'protein', 'carbs', 'fat', 'fiber')
+
+# Keyset orderings; each ends with the primary key so positions are unique
+SORTS = {
+    'id': ('id',),
+    'prep_time': ('prep_time', 'id'),
+}
+
+MealQuery = namedtuple('MealQuery', 'filters ranges search sort cursor limit')
+
+
+class MealQueryError(ValueError):
+    """Raised for browse or search parameters the API can't accept"""
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise MealQueryError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(SORTS[sort]):
+        raise MealQueryError('Invalid cursor')
+    # Every key is an integer column; only prep_time may be null
+    for column, value in zip(SORTS[sort], values):
+        if value is None and column == 'prep_time':
+            continue
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise MealQueryError('Invalid cursor')
+    return values
+
+
+def parse_meal_query(args):
+    """Validate /api/meals query string arguments"""
+    sort = args.get('sort', 'id')
+    if sort not in SORTS:
+        raise MealQueryError(f"sort must be one of {', '.join(SORTS)}")
+
+    filters = {}
+    for column in FILTER_COLUMNS:
+        value = args.get(column)
+        if value:
+            filters[column] = [item.strip() for item in value.split(',') if item.strip()]
+
+    ranges = {}
+    for column in RANGE_COLUMNS:
+        for bound in ('min', 'max'):
+            value = args.get(f'{bound}_{column}')
+            if value is None or value == '':
+                continue
+            try:
+                ranges[(column, bound)] = float(value)
+            except ValueError:
+                raise MealQueryError(f'{bound}_{column} must be a number')
+
+    search = (args.get('q') or '').strip()
+    if len(search) > MAX_QUERY_LENGTH:
+        raise MealQueryError(f'q must be at most {MAX_QUERY_LENGTH} characters')
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise MealQueryError('limit must be an integer')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise MealQueryError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+
+    cursor = args.get('cursor')
+    cursor = decode_cursor(cursor, sort) if cursor else None
+    return MealQuery(filters, ranges, search, sort, cursor, limit)
+
+
+def _fts5_query(search):
+    """FTS5 expression matching every word of ``search`` as a prefix"""
+    words = search.split()
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def search_clause(search):
+    """Full-text match on name, description and ingredients"""
+    if db.engine.dialect.name == 'postgresql':
+        return literal_column('meals.search_vector').op('@@')(func.websearch_to_tsquery('english', search))
+    matches = select(literal_column('rowid')).select_from(text('meals_fts')).where(
+        text('meals_fts MATCH :fts_query').bindparams(fts_query=_fts5_query(search))
+    )
+    return Meal.id.in_(matches)
+
+
+def _filtered(query, *columns):
+    statement = select(*columns)
+    for column, values in query.filters.items():
+        statement = statement.where(getattr(Meal, column).in_(values))
+    for (column, bound), value in query.ranges.items():
+        column = getattr(Meal, column)
+        statement = statement.where(column >= value if bound == 'min' else column <= value)
+    if query.search:
+        statement = statement.where(search_clause(query.search))
+    return statement
+
+
+def meal_statements(query, *columns):
+    """SELECTs of ``columns`` for meals matching ``query``, from its cursor on
+
+    Rows come in keyset order across the returned statements, each of
+    which seeks straight to its start through an index. Sorting by prep
+    time lists meals without one last, in a second statement, so
+    neither needs an OR that would defeat the index.
+    """
+    statement = _filtered(query, *columns)
+    cursor = query.cursor
+    if query.sort == 'id':
+        if cursor is not None:
+            statement = statement.where(Meal.id > cursor[0])
+        return [statement.order_by(Meal.id)]
+
+    timed = statement.where(Meal.prep_time.is_not(None)).order_by(Meal.prep_time, Meal.id)
+    untimed = statement.where(Meal.prep_time.is_(None)).order_by(Meal.id)
+    if cursor is None:
+        return [timed, untimed]
+    prep_time, meal_id = cursor
+    if prep_time is None:
+        return [untimed.where(Meal.id > meal_id)]
+    return [timed.where(tuple_(Meal.prep_time, Meal.id) > tuple_(prep_time, meal_id)), untimed]
+
+
+def _fetch(query, columns, count):
+    """Up to ``count`` matching rows in keyset order"""
+    rows = []
+    for statement in meal_statements(query, *columns):
+        rows.extend(db.session.execute(statement.limit(count - len(rows))).all())
+        if len(rows) >= count:
+            break
+    return rows
+
+
+def _cursor_for(row, sort):
+    return encode_cursor([getattr(row, column) for column in SORTS[sort]])
+
+
+def meal_page(query):
+    """One page of matching meal ids and the cursor of the next page, if any"""
+    key_columns = [getattr(Meal, column) for column in SORTS[query.sort]]
+    rows = _fetch(query, key_columns, query.limit + 1)
+    next_cursor = _cursor_for(rows[query.limit - 1], query.sort) if len(rows) > query.limit else None
+    return [row.id for row in rows[:query.limit]], next_cursor
+
+
+def export_meals(query, page_size=EXPORT_PAGE_SIZE):
+    """Yield every matching meal from the query's cursor on as NDJSON lines
+
+    Pages are read by keyset as plain rows, so neither the session nor
+    the payload cache grows with the export.
+    """
+    columns = Meal.__table__.columns
+    while True:
+        rows = _fetch(query, columns, page_size)
+        for row in rows:
+            yield dumps(meal_payload(row)) + '\n'
+        if len(rows) < page_size:
+            return
+        query = query._replace(cursor=[getattr(rows[-1], column) for column in SORTS[query.sort]])
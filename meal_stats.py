@@ -0,0 +1,170 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import case, delete, func, insert, literal, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from models import ArchivedRecommendations, Meal, MealHistory, MealRating, MealStats
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+# Columns added to the stored totals on conflict
+COUNTERS = ('recommendations', 'rating_sum', 'rating_count')
+
+# Orderings accepted by top_meals()
+SORTS = ('recommendations', 'rating')
+
+
+def _later(current, new):
+    return case((current.is_(None), new), (new > current, new), else_=current)
+
+
+def add_stats(deltas):
+    """Add per-meal deltas to meal_stats with one INSERT ... ON CONFLICT
+
+    ``deltas`` maps meal ids to dicts of COUNTERS increments and,
+    optionally, a last_recommended_at time. Rows go in meal id order so
+    concurrent writers lock them in the same order. The caller commits,
+    so the totals land in the same transaction as the rows they count.
+    """
+    if not deltas:
+        return
+    values = [
+        {'meal_id': meal_id, 'last_recommended_at': None, **dict.fromkeys(COUNTERS, 0), **delta}
+        for meal_id, delta in sorted(deltas.items())
+    ]
+    table = MealStats.__table__
+    statement = _INSERTS[db.engine.dialect.name](table).values(values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.meal_id],
+        set_={
+            **{column: table.c[column] + statement.excluded[column] for column in COUNTERS},
+            'last_recommended_at': _later(table.c.last_recommended_at, statement.excluded.last_recommended_at),
+        },
+    )
+    db.session.execute(statement)
+
+
+def record_recommendations(rows):
+    """Count new meal_history rows (dicts) in meal_stats"""
+    now = datetime.now()
+    deltas = {}
+    for row in rows:
+        delta = deltas.setdefault(row['meal_id'], {'recommendations': 0, 'last_recommended_at': None})
+        delta['recommendations'] += 1
+        created_at = row.get('created_at') or now
+        if delta['last_recommended_at'] is None or created_at > delta['last_recommended_at']:
+            delta['last_recommended_at'] = created_at
+    add_stats(deltas)
+
+
+def record_ratings(ratings, previous):
+    """Apply new ratings ({meal_id: rating}) to meal_stats
+
+    ``previous`` holds the ratings they replaced, read by the writer
+    under a row lock; a changed rating moves the sum by the difference
+    and leaves the count alone.
+    """
+    deltas = {}
+    for meal_id, rating in ratings.items():
+        if meal_id in previous:
+            if rating != previous[meal_id]:
+                deltas[meal_id] = {'rating_sum': rating - previous[meal_id]}
+        else:
+            deltas[meal_id] = {'rating_sum': rating, 'rating_count': 1}
+    add_stats(deltas)
+
+
+def archive_recommendations(condition):
+    """Add the per-meal counts of the meal_history rows matching ``condition``
+    to archived_recommendations, before those rows are archived and removed"""
+    counts = db.session.execute(
+        select(MealHistory.meal_id, func.count(), func.max(MealHistory.created_at))
+        .where(condition).group_by(MealHistory.meal_id).order_by(MealHistory.meal_id)
+    ).all()
+    if not counts:
+        return
+    table = ArchivedRecommendations.__table__
+    statement = _INSERTS[db.engine.dialect.name](table).values([
+        {'meal_id': meal_id, 'recommendations': count, 'last_recommended_at': last}
+        for meal_id, count, last in counts
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.meal_id],
+        set_={
+            'recommendations': table.c.recommendations + statement.excluded.recommendations,
+            'last_recommended_at': _later(table.c.last_recommended_at, statement.excluded.last_recommended_at),
+        },
+    )
+    db.session.execute(statement)
+
+
+def reconcile_meal_stats():
+    """Rebuild meal_stats from meal_history and meal_ratings in one transaction
+
+    Recomputes every total from scratch, e.g. to fill the table for
+    history written before it existed or after meal changes made outside
+    the app.
+    Counts of archived history come from archived_recommendations.
+    Returns the number of meals with stats.
+    """
+    recommended = union_all(
+        select(MealHistory.meal_id, MealHistory.created_at.label('created_at'), literal(1).label('count')),
+        select(
+            ArchivedRecommendations.meal_id,
+            ArchivedRecommendations.last_recommended_at,
+            ArchivedRecommendations.recommendations,
+        ),
+    ).subquery()
+    history = select(
+        recommended.c.meal_id,
+        func.sum(recommended.c.count).label('recommendations'),
+        func.max(recommended.c.created_at).label('last_recommended_at'),
+    ).group_by(recommended.c.meal_id).subquery()
+    ratings = select(
+        MealRating.meal_id,
+        func.sum(MealRating.rating).label('rating_sum'),
+        func.count().label('rating_count'),
+    ).group_by(MealRating.meal_id).subquery()
+    rows = select(
+        Meal.id,
+        func.coalesce(history.c.recommendations, 0),
+        history.c.last_recommended_at,
+        func.coalesce(ratings.c.rating_sum, 0),
+        func.coalesce(ratings.c.rating_count, 0),
+    ).outerjoin(history, history.c.meal_id == Meal.id).outerjoin(
+        ratings, ratings.c.meal_id == Meal.id
+    ).where(history.c.meal_id.is_not(None) | ratings.c.meal_id.is_not(None))
+
+    db.session.execute(delete(MealStats))
+    db.session.execute(insert(MealStats).from_select(
+        ['meal_id', 'recommendations', 'last_recommended_at', 'rating_sum', 'rating_count'], rows
+    ))
+    count = db.session.query(MealStats.meal_id).count()
+    db.session.commit()
+    logging.info("Reconciled stats for %d meals", count)
+    return count
+
+
+def top_meals(sort='recommendations', limit=50, min_ratings=1):
+    """Meals with the most recommendations or the best average rating"""
+    average = MealStats.rating_sum * 1.0 / MealStats.rating_count
+    statement = select(
+        MealStats.meal_id,
+        Meal.name,
+        MealStats.recommendations,
+        MealStats.last_recommended_at,
+        MealStats.rating_count,
+        case((MealStats.rating_count > 0, average), else_=None).label('average_rating'),
+    ).join(Meal, Meal.id == MealStats.meal_id)
+    if sort == 'rating':
+        statement = statement.where(MealStats.rating_count >= max(min_ratings, 1)).order_by(
+            average.desc(), MealStats.rating_count.desc(), MealStats.meal_id
+        )
+    else:
+        statement = statement.order_by(MealStats.recommendations.desc(), MealStats.meal_id)
+    return db.session.execute(statement.limit(limit)).all()
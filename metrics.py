@@ -0,0 +1,268 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of the queries-per-request histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Queries listed in a slow request's log line
+SLOW_LOG_TOP_QUERIES = 5
+
+# Characters of each statement kept in the slow request log
+STATEMENT_LOG_LENGTH = 200
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram keyed by a label tuple"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(series.items()):
+            pairs = list(zip(self.label_names, labels))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_labels(pairs, le=_number(bound))} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_labels(pairs, le="+Inf")} {count}')
+            lines.append(f'{self.name}_sum{_labels(pairs)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(pairs)} {count}')
+        return lines
+
+
+class Counter:
+    """Monotonic Prometheus counter keyed by a label tuple"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(zip(self.label_names, labels))} {_number(value)}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs, **extra):
+    pairs = [*pairs, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+request_latency = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method'))
+request_count = Counter(
+    'http_requests_total', 'Requests by endpoint and status.', ('endpoint', 'method', 'status'))
+request_phase = Histogram(
+    'http_request_phase_duration_seconds', 'Time spent in named phases of a request.', ('endpoint', 'phase'))
+queries_per_request = Histogram(
+    'db_queries_per_request', 'SQL statements executed per request.', ('endpoint',), QUERY_COUNT_BUCKETS)
+query_latency = Histogram(
+    'db_query_duration_seconds', 'SQL statement latency by endpoint.', ('endpoint',))
+pool_wait = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.', ())
+pool_checkouts = Counter(
+    'db_pool_checkouts_total', 'Connections checked out of the pool.', ())
+
+HISTOGRAMS = (request_latency, request_phase, queries_per_request, query_latency, pool_wait)
+COUNTERS = (request_count, pool_checkouts)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.observe((), time.perf_counter() - started)
+
+
+def _endpoint():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'background'
+
+
+@contextmanager
+def timed(phase):
+    """Record the time spent in ``phase`` of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        request_phase.observe((_endpoint(), phase), elapsed)
+        if has_request_context() and 'metrics_phases' in g:
+            g.metrics_phases[phase] = g.metrics_phases.get(phase, 0.0) + elapsed
+
+
+# Start times are keyed by cursor, so a failed statement can't leave one
+# behind for the next statement on the connection to pick up
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', {})[id(cursor)] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started', {}).pop(id(cursor), None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    query_latency.observe((_endpoint(),), elapsed)
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries.append((statement, elapsed))
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    context = exception_context.execution_context
+    if conn is not None and context is not None:
+        conn.info.get('query_started', {}).pop(id(context.cursor), None)
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_checkouts.inc(())
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = []
+    g.metrics_phases = {}
+
+
+def _finish_request(status):
+    if 'metrics_started' not in g:
+        return
+    elapsed = time.perf_counter() - g.pop('metrics_started')
+    queries = g.pop('metrics_queries', [])
+    phases = g.pop('metrics_phases', {})
+    endpoint = request.endpoint or 'unmatched'
+    request_latency.observe((endpoint, request.method), elapsed)
+    request_count.inc((endpoint, request.method, str(status)))
+    queries_per_request.observe((endpoint,), len(queries))
+
+    threshold = current_app.config.get('SLOW_REQUEST_MS', 500)
+    if threshold and elapsed * 1000 >= threshold:
+        log_slow_request(endpoint, status, elapsed, queries, phases)
+
+
+def log_slow_request(endpoint, status, elapsed, queries, phases):
+    """One JSON log line with the request's time split and its costliest queries"""
+    grouped = {}
+    for statement, query_elapsed in queries:
+        entry = grouped.setdefault(statement, [0, 0.0])
+        entry[0] += 1
+        entry[1] += query_elapsed
+    top = sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)[:SLOW_LOG_TOP_QUERIES]
+    logging.warning("slow request %s", json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'endpoint': endpoint,
+        'status': status,
+        'duration_ms': round(elapsed * 1000, 2),
+        'sql_count': len(queries),
+        'sql_ms': round(sum(query_elapsed for _, query_elapsed in queries) * 1000, 2),
+        'phases_ms': {phase: round(seconds * 1000, 2) for phase, seconds in phases.items()},
+        'top_queries': [
+            {
+                'statement': ' '.join(statement.split())[:STATEMENT_LOG_LENGTH],
+                'count': count,
+                'total_ms': round(total * 1000, 2),
+            }
+            for statement, (count, total) in top
+        ],
+    }))
+
+
+def init_app(app, db):
+    """Install the request hooks and SQL event listeners"""
+
+    @app.before_request
+    def start_request_metrics():
+        _start_request()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        _finish_request(response.status_code)
+        return response
+
+    @app.teardown_request
+    def finish_failed_request_metrics(exc):
+        # Only reached with the metrics still pending when the view raised
+        _finish_request(500)
+
+    with app.app_context():
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+        event.listen(engine, 'checkout', _on_checkout)
+
+
+def render(stats=None):
+    """All metrics in the Prometheus text format
+
+    ``stats`` maps a component name to a dict of numeric values, exported
+    as ``app_<component>_<key>`` gauges.
+    """
+    lines = []
+    for metric in (*HISTOGRAMS, *COUNTERS):
+        lines.extend(metric.samples())
+    for component, values in (stats or {}).items():
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            name = f'app_{component}_{key}'
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {_number(value)}')
+    return '\n'.join(lines) + '\n'
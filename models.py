@@ -25,6 +25,12 @@ class User(UserMixin, db.Model):
     allergies = db.Column(db.Text, nullable=True)  # JSON string
     health_goals = db.Column(db.String(100), nullable=True)
 
+    # Derived on profile save (see profiles.update_derived_profile)
+    segment_key = db.Column(db.String(80), nullable=True, index=True)  # age_group|gender|weight_category|activity_level
+    bmi = db.Column(db.Float, nullable=True)
+    allergy_set = db.Column(db.Text, nullable=True)  # JSON list, normalized and sorted
+    dietary_mask = db.Column(db.Integer, nullable=True)  # bit per profiles.DIETARY_PREFERENCES entry
+
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime,
                            default=datetime.now,
@@ -81,6 +87,26 @@ class Meal(db.Model):
     # Relationships
     meal_history = db.relationship('MealHistory', backref='meal', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_meals_classification', 'age_group', 'gender', 'weight_category', 'activity_level'),
+        db.Index('ix_meals_prep_time_id', 'prep_time', 'id'),  # /api/meals?sort=prep_time
+        db.Index('ux_meals_name', 'name', unique=True),  # catalog import upserts on name
+    )
+
+
+class Ingredient(db.Model):
+    __tablename__ = 'ingredients'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), unique=True, nullable=False)  # normalized, lowercase
+
+
+# Meal <-> ingredient association, kept in sync with Meal.ingredients
+meal_ingredients = db.Table(
+    'meal_ingredients',
+    db.Column('meal_id', db.Integer, db.ForeignKey('meals.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('ingredient_id', db.Integer, db.ForeignKey('ingredients.id'), primary_key=True, index=True),
+)
+
 
 class MealHistory(db.Model):
     __tablename__ = 'meal_history'
@@ -91,6 +117,55 @@ class MealHistory(db.Model):
     notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.now)
 
+    __table_args__ = (
+        db.Index('ix_meal_history_user_created', 'user_id', 'created_at'),  # home's recent meals
+    )
+
+
+class MealRating(db.Model):
+    __tablename__ = 'meal_ratings'
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), primary_key=True)
+    meal_id = db.Column(db.Integer, db.ForeignKey('meals.id'), primary_key=True)
+    rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
+    notes = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+# Running per-meal totals over meal_history and meal_ratings
+class MealStats(db.Model):
+    __tablename__ = 'meal_stats'
+    meal_id = db.Column(db.Integer, db.ForeignKey('meals.id', ondelete='CASCADE'), primary_key=True)
+    recommendations = db.Column(db.Integer, nullable=False, default=0)
+    last_recommended_at = db.Column(db.DateTime, nullable=True)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_meal_stats_recommendations', 'recommendations'),  # most recommended meals
+    )
+
+
+# Per-meal counts of meal_history rows moved out to archive files
+class ArchivedRecommendations(db.Model):
+    __tablename__ = 'archived_recommendations'
+    meal_id = db.Column(db.Integer, db.ForeignKey('meals.id', ondelete='CASCADE'), primary_key=True)
+    recommendations = db.Column(db.Integer, nullable=False, default=0)
+    last_recommended_at = db.Column(db.DateTime, nullable=True)
+
+
+# Nutrients of the meals recommended to each user per day, summed from meal_history
+class UserDailyNutrition(db.Model):
+    __tablename__ = 'user_daily_nutrition'
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    meals = db.Column(db.Integer, nullable=False, default=0)
+    calories = db.Column(db.Float, nullable=False, default=0.0)
+    protein = db.Column(db.Float, nullable=False, default=0.0)
+    carbs = db.Column(db.Float, nullable=False, default=0.0)
+    fat = db.Column(db.Float, nullable=False, default=0.0)
+    fiber = db.Column(db.Float, nullable=False, default=0.0)
+
 
 class UserPreference(db.Model):
     __tablename__ = 'user_preferences'
@@ -111,3 +186,15 @@ class HealthTip(db.Model):
     target_demographic = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.now)
     is_active = db.Column(db.Boolean, default=True)
+
+    __table_args__ = (
+        db.Index('ux_health_tips_title', 'title', unique=True),  # catalog import upserts on title
+    )
+
+
+# Change counter per cached data domain, bumped by every writing transaction
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+    name = db.Column(db.String(32), primary_key=True)  # catalog, tips
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
@@ -0,0 +1,154 @@
+import logging
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from catalog import NUTRIENT_COLUMNS, catalog_index
+from models import Meal, MealHistory, User, UserDailyNutrition
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+# Longest range one /api/nutrition_summary call covers, in days
+MAX_SUMMARY_DAYS = 366
+
+# Range covered when the caller gives no start date
+DEFAULT_SUMMARY_DAYS = 30
+
+# Users whose history is re-summed per backfill transaction
+BACKFILL_USER_CHUNK = 500
+
+# Columns added to the stored totals on conflict
+TOTALS = ('meals', *NUTRIENT_COLUMNS)
+
+
+class NutritionQueryError(ValueError):
+    """Raised for a summary range the API can't accept"""
+
+
+def _parse_day(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise NutritionQueryError(f'{name} must be a date (YYYY-MM-DD)')
+
+
+def parse_summary_range(args):
+    """Validate the from/to arguments of /api/nutrition_summary; both ends are inclusive"""
+    end = _parse_day(args['to'], 'to') if args.get('to') else date.today()
+    start = _parse_day(args['from'], 'from') if args.get('from') else end - timedelta(days=DEFAULT_SUMMARY_DAYS - 1)
+    if start > end:
+        raise NutritionQueryError('from must not be after to')
+    if (end - start).days >= MAX_SUMMARY_DAYS:
+        raise NutritionQueryError(f'The range can cover at most {MAX_SUMMARY_DAYS} days')
+    return start, end
+
+
+def _meal_nutrients(meal_ids):
+    """{meal_id: nutrient tuple} from the catalog snapshot, querying only meals it lacks"""
+    snapshot = catalog_index.snapshot()
+    found = {}
+    missing = []
+    for meal_id in meal_ids:
+        position = snapshot.position(meal_id)
+        if position is None:
+            missing.append(meal_id)
+        else:
+            found[meal_id] = snapshot.nutrients[position].tolist()
+    if missing:
+        columns = [getattr(Meal, column) for column in NUTRIENT_COLUMNS]
+        for meal_id, *values in db.session.execute(select(Meal.id, *columns).where(Meal.id.in_(missing))):
+            found[meal_id] = [value or 0.0 for value in values]
+    return found
+
+
+def record_nutrition(rows, day=None):
+    """Add new meal_history rows (dicts) to their users' daily totals
+
+    Rows count toward ``day`` if given, else the day they were created.
+    One INSERT ... ON CONFLICT covers the batch; the caller commits, so
+    the totals land with the history rows.
+    """
+    nutrients = _meal_nutrients({row['meal_id'] for row in rows})
+    now = datetime.now()
+    totals = {}
+    for row in rows:
+        values = nutrients.get(row['meal_id'])
+        if values is None:
+            continue
+        key = (row['user_id'], day or (row.get('created_at') or now).date())
+        entry = totals.setdefault(key, [0] + [0.0] * len(NUTRIENT_COLUMNS))
+        entry[0] += 1
+        for index, value in enumerate(values, 1):
+            entry[index] += value
+    if not totals:
+        return
+
+    values = [
+        {'user_id': user_id, 'day': day, **dict(zip(TOTALS, entry))}
+        for (user_id, day), entry in sorted(totals.items())
+    ]
+    table = UserDailyNutrition.__table__
+    statement = _INSERTS[db.engine.dialect.name](table).values(values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.day],
+        set_={column: table.c[column] + statement.excluded[column] for column in TOTALS},
+    )
+    db.session.execute(statement)
+
+
+def daily_summary(user_id, start, end):
+    """Stored daily totals of ``user_id`` from ``start`` to ``end`` inclusive"""
+    return db.session.execute(
+        select(UserDailyNutrition).where(
+            UserDailyNutrition.user_id == user_id,
+            UserDailyNutrition.day.between(start, end),
+        ).order_by(UserDailyNutrition.day)
+    ).scalars().all()
+
+
+def backfill_nutrition(chunk_size=BACKFILL_USER_CHUNK):
+    """Recompute user_daily_nutrition from meal_history, a chunk of users per transaction
+
+    Each chunk's rows are replaced by sums over the meals' current
+    nutrients, so the job can be rerun at any time. Days older than the
+    oldest history row were archived and keep their stored totals.
+    meal_history doesn't record the day a batch plan was made for, so
+    planned meals are recounted on the day they were recommended.
+    Returns the number of daily rows written.
+    """
+    oldest = db.session.scalar(select(func.min(MealHistory.created_at)))
+    if oldest is None:
+        return 0
+    day = func.date(MealHistory.created_at)
+    count = 0
+    last_id = ''
+    while True:
+        user_ids = db.session.scalars(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(chunk_size)
+        ).all()
+        if not user_ids:
+            break
+        last_id = user_ids[-1]
+
+        sums = select(
+            MealHistory.user_id,
+            day,
+            func.count(),
+            *(func.coalesce(func.sum(getattr(Meal, column)), 0.0) for column in NUTRIENT_COLUMNS),
+        ).join(Meal, Meal.id == MealHistory.meal_id).where(
+            MealHistory.user_id.in_(user_ids)
+        ).group_by(MealHistory.user_id, day)
+        db.session.execute(delete(UserDailyNutrition).where(
+            UserDailyNutrition.user_id.in_(user_ids),
+            UserDailyNutrition.day >= oldest.date(),
+        ))
+        result = db.session.execute(insert(UserDailyNutrition).from_select(['user_id', 'day', *TOTALS], sums))
+        db.session.commit()
+        count += max(result.rowcount, 0)
+    logging.info("Backfilled %d daily nutrition rows", count)
+    return count
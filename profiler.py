@@ -0,0 +1,161 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, request
+
+# Most distinct stacks kept per route; rarer stacks seen later are dropped
+MAX_STACKS_PER_ROUTE = 20000
+
+# Deepest stack recorded, counted from the innermost frame
+MAX_STACK_DEPTH = 128
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def collapse(frame):
+    """Semicolon-joined stack from the outermost frame down to ``frame``"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads serving profiled requests.
+
+    A single background thread wakes every ``interval`` seconds while at
+    least one profiled request is running, reads every registered
+    thread's current frame and counts the collapsed stack under the
+    request's route. Nothing runs while no request is being profiled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+        self._stacks = {}
+        self._requests = Counter()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.interval = 0.001
+        self.samples = 0
+        self.dropped = 0
+
+    def start(self, route):
+        """Begin sampling the calling thread under ``route``"""
+        self._ensure_thread()
+        with self._lock:
+            self._active[threading.get_ident()] = route
+            self._requests[route] += 1
+        self._wake.set()
+
+    def stop(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def routes(self):
+        with self._lock:
+            return {
+                route: {'requests': count, 'samples': sum(self._stacks.get(route, {}).values())}
+                for route, count in self._requests.items()
+            }
+
+    def collapsed(self, route):
+        """Collapsed-stack text (``stack count`` per line) for ``route``"""
+        with self._lock:
+            stacks = dict(self._stacks.get(route, {}))
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+    def reset(self, route=None):
+        with self._lock:
+            if route is None:
+                self._stacks.clear()
+                self._requests.clear()
+            else:
+                self._stacks.pop(route, None)
+                self._requests.pop(route, None)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                active = dict(self._active)
+                if not active:
+                    self._wake.clear()
+                    continue
+            frames = sys._current_frames()
+            for thread_id, route in active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._record(route, collapse(frame))
+            del frames
+            time.sleep(self.interval)
+
+    def _record(self, route, stack):
+        with self._lock:
+            stacks = self._stacks.setdefault(route, {})
+            if stack in stacks:
+                stacks[stack] += 1
+            elif len(stacks) < MAX_STACKS_PER_ROUTE:
+                stacks[stack] = 1
+            else:
+                self.dropped += 1
+                return
+            self.samples += 1
+
+
+request_profiler = SamplingProfiler()
+
+
+def should_profile():
+    """Sample a share of requests, plus any carrying the profiling token"""
+    config = current_app.config
+    rate = config.get('PROFILE_SAMPLE_RATE', 0.0)
+    if rate and random.random() < rate:
+        return True
+    token = config.get('PROFILE_TOKEN')
+    return bool(token) and request.headers.get('X-Profile') == token
+
+
+def write_collapsed(route, directory):
+    """Save ``route``'s collapsed stacks to a timestamped .folded file"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{route}-{datetime.now().strftime('%Y%m%d%H%M%S')}.folded")
+    with open(path, 'w') as f:
+        f.write(request_profiler.collapsed(route))
+    return path
+
+
+def init_app(app):
+    """Install the request hooks that start and stop sampling"""
+
+    @app.before_request
+    def start_profiling():
+        if should_profile():
+            request_profiler.interval = app.config.get('PROFILE_INTERVAL_MS', 1.0) / 1000
+            g.profiling = True
+            request_profiler.start(request.endpoint or 'unmatched')
+
+    @app.teardown_request
+    def stop_profiling(exc):
+        if g.pop('profiling', False):
+            request_profiler.stop()
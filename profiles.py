@@ -0,0 +1,151 @@
+import json
+import logging
+from collections import namedtuple
+
+from app import db
+from ingredients import normalize_ingredient
+from models import User
+
+# Dietary preference choices offered on the profile page; bit i of
+# User.dietary_mask is set when DIETARY_PREFERENCES[i] is selected
+DIETARY_PREFERENCES = (
+    'vegetarian', 'vegan', 'pescatarian', 'keto', 'paleo', 'mediterranean',
+    'low_carb', 'low_fat', 'high_protein', 'gluten_free', 'dairy_free', 'low_sodium',
+)
+
+# Defaults applied when the profile is incomplete
+DEFAULT_AGE = 25
+DEFAULT_WEIGHT = 70  # kg
+DEFAULT_HEIGHT = 1.7  # meters
+
+# Heights above this are taken to be in centimeters
+MAX_HEIGHT_METERS = 3
+
+# Users processed per transaction by the backfill
+BACKFILL_BATCH_SIZE = 500
+
+Profile = namedtuple('Profile', 'age_group gender weight_category activity_level bmi allergies dietary_mask')
+
+
+def height_in_meters(height):
+    """Height from the profile form in meters; the form asks for centimeters"""
+    if height is not None and height > MAX_HEIGHT_METERS:
+        return height / 100
+    return height
+
+
+def classify(age, weight, height, gender, activity_level):
+    """Derive the recommendation segment and BMI from raw profile fields"""
+    age = age or DEFAULT_AGE
+    weight = weight or DEFAULT_WEIGHT
+    height = height or DEFAULT_HEIGHT
+
+    # Classify user into categories
+    if age < 25:
+        age_group = 'young'
+    elif age >= 65:
+        age_group = 'senior'
+    else:
+        age_group = 'adult'
+
+    # Weight category classification (simplified BMI logic)
+    bmi = weight / (height ** 2)
+    if bmi < 18.5:
+        weight_category = 'underweight'
+    elif bmi > 25:
+        weight_category = 'overweight'
+    else:
+        weight_category = 'normal'
+
+    segment = (age_group, gender or 'any', weight_category, activity_level or 'moderate')
+    return segment, round(bmi, 2)
+
+
+def segment_key(segment):
+    return '|'.join(segment)
+
+
+def parse_segment_key(key):
+    return tuple(key.split('|'))
+
+
+def dietary_mask(preferences):
+    mask = 0
+    for preference in preferences:
+        if preference in DIETARY_PREFERENCES:
+            mask |= 1 << DIETARY_PREFERENCES.index(preference)
+    return mask
+
+
+def _load_list(text):
+    try:
+        values = json.loads(text or '[]')
+    except json.JSONDecodeError:
+        return []
+    return values if isinstance(values, list) else []
+
+
+def update_derived_profile(user):
+    """Store the segment, BMI, allergy set and dietary mask on ``user``"""
+    segment, bmi = classify(user.age, user.weight, user.height, user.gender, user.activity_level)
+    allergies = sorted({normalize_ingredient(allergy) for allergy in _load_list(user.allergies)} - {''})
+    user.segment_key = segment_key(segment)
+    user.bmi = bmi
+    user.allergy_set = json.dumps(allergies)
+    user.dietary_mask = dietary_mask(_load_list(user.dietary_preferences))
+
+
+def user_profile(user):
+    """Compact recommendation profile for ``user``
+
+    Reads the values stored at profile save; users saved before those
+    columns existed are classified on the fly until they are backfilled.
+    """
+    if user.segment_key is None:
+        update_derived_profile(user)
+    segment = parse_segment_key(user.segment_key)
+    return Profile(*segment, user.bmi, tuple(json.loads(user.allergy_set)), user.dietary_mask or 0)
+
+
+def convert_legacy_heights():
+    """Convert heights saved in centimeters to meters and reclassify those users
+
+    Profiles saved before heights were normalized hold the form's
+    centimeters, which classify() and the nutrient targets read as
+    meters. Runs at startup; returns the number of users converted.
+    """
+    count = 0
+    last_id = ''
+    while True:
+        users = User.query.filter(User.height > MAX_HEIGHT_METERS, User.id > last_id).order_by(
+            User.id
+        ).limit(BACKFILL_BATCH_SIZE).all()
+        if not users:
+            break
+        for user in users:
+            user.height = height_in_meters(user.height)
+            update_derived_profile(user)
+        last_id = users[-1].id
+        db.session.commit()
+        count += len(users)
+    if count:
+        logging.info("Converted the heights of %d users to meters", count)
+    return count
+
+
+def backfill_profiles():
+    """Compute derived profile values for every user, in batches"""
+    convert_legacy_heights()
+    count = 0
+    last_id = ''
+    while True:
+        users = User.query.filter(User.id > last_id).order_by(User.id).limit(BACKFILL_BATCH_SIZE).all()
+        if not users:
+            break
+        for user in users:
+            update_derived_profile(user)
+        last_id = users[-1].id
+        db.session.commit()
+        count += len(users)
+    logging.info("Backfilled derived profiles for %d users", count)
+    return count
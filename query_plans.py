@@ -0,0 +1,92 @@
+import json
+from datetime import date
+
+from sqlalchemy import select, text, tuple_
+
+from app import db
+from history_partitions import recent_history_cutoff
+from models import Meal, MealHistory, MealRating, UserDailyNutrition
+from recent_meals import recent_meals_statement
+
+SAMPLE_USER_ID = 'plan-check'
+SAMPLE_MEAL_ID = 1
+
+
+def _either(column, value):
+    return (column == value) | (column == 'any')
+
+
+# Queries on the request path that must be served from an index
+HOT_QUERIES = {
+    'home_recent_meals': lambda: select(MealHistory, Meal, MealRating.rating).select_from(
+        MealHistory
+    ).join(Meal, Meal.id == MealHistory.meal_id).outerjoin(
+        MealRating,
+        (MealRating.user_id == MealHistory.user_id) & (MealRating.meal_id == MealHistory.meal_id),
+    ).where(
+        MealHistory.user_id == SAMPLE_USER_ID,
+        MealHistory.created_at >= recent_history_cutoff(),
+    ).order_by(MealHistory.created_at.desc()).limit(3),
+    'recent_meal_ids': lambda: recent_meals_statement(SAMPLE_USER_ID, 21),
+    'nutrition_summary': lambda: select(UserDailyNutrition).where(
+        UserDailyNutrition.user_id == SAMPLE_USER_ID,
+        UserDailyNutrition.day.between(date(2024, 1, 1), date(2024, 12, 31)),
+    ).order_by(UserDailyNutrition.day),
+    'rate_meal_lookup': lambda: select(MealRating).where(
+        MealRating.user_id == SAMPLE_USER_ID,
+        MealRating.meal_id == SAMPLE_MEAL_ID,
+    ),
+    'meals_page_by_prep_time': lambda: select(Meal.id).where(
+        Meal.prep_time.is_not(None),
+        tuple_(Meal.prep_time, Meal.id) > tuple_(30, SAMPLE_MEAL_ID),
+    ).order_by(Meal.prep_time, Meal.id).limit(50),
+    'meals_by_classification': lambda: select(Meal.id).where(
+        _either(Meal.age_group, 'adult'),
+        _either(Meal.gender, 'female'),
+        _either(Meal.weight_category, 'normal'),
+        _either(Meal.activity_level, 'moderate'),
+    ),
+}
+
+
+def _compile(statement):
+    dialect = db.engine.dialect
+    return str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+
+def _sqlite_scans(connection, sql):
+    plan = connection.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+    details = [row[-1] for row in plan]
+    scans = [detail for detail in details
+             if detail.startswith('SCAN ') and 'INDEX' not in detail]
+    return details, scans
+
+
+def _postgresql_scans(connection, sql):
+    # With sequential scans priced out, any that remain have no usable index
+    connection.execute(text('SET LOCAL enable_seqscan = off'))
+    plan = connection.execute(text('EXPLAIN (FORMAT JSON) ' + sql)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    details, scans = [], []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        detail = f"{node['Node Type']} {node.get('Relation Name', '')}".strip()
+        details.append(detail)
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(detail)
+        nodes.extend(node.get('Plans', []))
+    return details, scans
+
+
+def check_query_plans():
+    """EXPLAIN every hot query; returns {name: (plan lines, sequential scans)}"""
+    explain = _postgresql_scans if db.engine.dialect.name == 'postgresql' else _sqlite_scans
+    results = {}
+    with db.engine.connect() as connection:
+        for name, build in HOT_QUERIES.items():
+            with connection.begin():
+                results[name] = explain(connection, _compile(build()))
+    return results
@@ -0,0 +1,131 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from catalog import catalog_index
+from meal_stats import record_ratings
+from models import MealHistory, MealRating
+
+# Most ratings accepted by one /api/rate_meals call
+MAX_BATCH_RATINGS = 500
+
+# Rows per statement when copying legacy ratings out of meal_history
+BACKFILL_BATCH_SIZE = 1000
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+class RatingError(ValueError):
+    """Raised for a rating payload the API can't accept"""
+
+
+def clean_rating(data):
+    """Validate one {'meal_id', 'rating', 'notes'} payload"""
+    if not isinstance(data, dict):
+        raise RatingError('Each rating must be an object')
+    meal_id = data.get('meal_id')
+    rating = data.get('rating')
+    if not meal_id or not rating:
+        raise RatingError('Missing required fields')
+    try:
+        meal_id = int(meal_id)
+        rating = int(rating)
+    except (TypeError, ValueError):
+        raise RatingError('meal_id and rating must be integers')
+    if not 1 <= rating <= 5:
+        raise RatingError('rating must be between 1 and 5')
+    if catalog_index.snapshot().position(meal_id) is None:
+        raise RatingError(f'Unknown meal {meal_id}')
+    return {'meal_id': meal_id, 'rating': rating, 'notes': data.get('notes', '') or ''}
+
+
+def upsert_ratings(user_id, ratings):
+    """Write ``ratings`` for ``user_id`` and update meal_stats in the same transaction
+
+    Later entries for the same meal win. New ratings go in with INSERT
+    ... ON CONFLICT DO NOTHING; the rest are locked before their old
+    values are read, so concurrent updates of one rating each apply their
+    delta against the value they replace. The caller commits.
+    """
+    rows = {}
+    now = datetime.now()
+    for rating in ratings:
+        rows[rating['meal_id']] = {
+            'user_id': user_id,
+            'meal_id': rating['meal_id'],
+            'rating': rating['rating'],
+            'notes': rating.get('notes'),
+            'created_at': now,
+            'updated_at': now,
+        }
+    if not rows:
+        return
+
+    # Meal id order, so concurrent writers lock rows in the same order
+    rows = dict(sorted(rows.items()))
+    insert = _INSERTS[db.engine.dialect.name]
+    inserted = set(db.session.scalars(
+        insert(MealRating).values(list(rows.values())).on_conflict_do_nothing().returning(MealRating.meal_id)
+    ))
+
+    previous = {}
+    existing = [row for meal_id, row in rows.items() if meal_id not in inserted]
+    if existing:
+        previous = dict(db.session.execute(
+            select(MealRating.meal_id, MealRating.rating).where(
+                MealRating.user_id == user_id,
+                MealRating.meal_id.in_([row['meal_id'] for row in existing]),
+            ).order_by(MealRating.meal_id).with_for_update()
+        ).all())
+        statement = insert(MealRating).values(existing)
+        statement = statement.on_conflict_do_update(
+            index_elements=[MealRating.user_id, MealRating.meal_id],
+            set_={
+                'rating': statement.excluded.rating,
+                'notes': statement.excluded.notes,
+                'updated_at': statement.excluded.updated_at,
+            },
+        )
+        db.session.execute(statement)
+
+    record_ratings({meal_id: row['rating'] for meal_id, row in rows.items()}, previous)
+
+
+def backfill_ratings():
+    """Copy ratings stored on meal_history rows into meal_ratings
+
+    The newest rated history row wins for each (user, meal) pair.
+    """
+    latest = select(
+        MealHistory.user_id,
+        MealHistory.meal_id,
+        func.max(MealHistory.id).label('id'),
+    ).where(MealHistory.rating.isnot(None)).group_by(
+        MealHistory.user_id, MealHistory.meal_id
+    ).subquery()
+    rows = db.session.execute(
+        select(MealHistory.user_id, MealHistory.meal_id, MealHistory.rating, MealHistory.notes)
+        .join(latest, MealHistory.id == latest.c.id)
+        .order_by(MealHistory.user_id)
+        .execution_options(yield_per=BACKFILL_BATCH_SIZE)
+    )
+
+    count = 0
+    for partition in rows.partitions():
+        by_user = {}
+        for row in partition:
+            by_user.setdefault(row.user_id, []).append(
+                {'meal_id': row.meal_id, 'rating': row.rating, 'notes': row.notes}
+            )
+        for user_id, ratings in by_user.items():
+            upsert_ratings(user_id, ratings)
+        count += len(partition)
+    db.session.commit()
+    logging.info("Backfilled %d meal ratings", count)
+    return count
@@ -0,0 +1,90 @@
+from array import array
+
+from sqlalchemy import select
+
+from app import app, db
+from history_partitions import recent_history_cutoff
+from models import MealHistory
+from ttl_cache import TTLCache
+
+
+def recent_meals_statement(user_id, limit):
+    """The ``limit`` meals most recently recommended to ``user_id``, newest first"""
+    return select(MealHistory.meal_id).where(
+        MealHistory.user_id == user_id,
+        MealHistory.created_at >= recent_history_cutoff(),
+    ).order_by(MealHistory.created_at.desc()).limit(limit)
+
+
+class RecentRing:
+    """The last ``size`` meal ids recommended to one user; the oldest is overwritten first"""
+
+    __slots__ = ('ids', 'count')
+
+    def __init__(self, size, meal_ids=()):
+        self.ids = array('q', bytes(8 * size))
+        self.count = 0
+        for meal_id in meal_ids:
+            self.add(meal_id)
+
+    def add(self, meal_id):
+        self.ids[self.count % len(self.ids)] = meal_id
+        self.count += 1
+
+    def __iter__(self):
+        return iter(self.ids[:min(self.count, len(self.ids))])
+
+
+class RecentMeals:
+    """Per-user rings of recently recommended meals, bounded in users and age.
+
+    A user missing from the store (first request, evicted or expired) is
+    loaded from meal_history in one indexed query; meals this worker
+    recommends are added as they are served. Entries expire after
+    RECENT_MEALS_TTL_SECONDS, so meals recommended by other workers are
+    picked up on the next load.
+    """
+
+    def __init__(self):
+        self._rings = TTLCache(maxsize=app.config.get('RECENT_MEALS_USERS', 10000),
+                               ttl=app.config.get('RECENT_MEALS_TTL_SECONDS', 300))
+        self.loads = 0
+
+    def ring(self, user_id, size):
+        ring = self._rings.get(user_id)
+        if ring is None or len(ring.ids) != size:
+            recent = db.session.scalars(recent_meals_statement(user_id, size)).all()
+            ring = RecentRing(size, reversed(recent))
+            self.loads += 1
+            self._rings.set(user_id, ring)
+        return ring
+
+    def exclude(self, snapshot, user_id, mask, keep):
+        """Drop meals recently recommended to ``user_id`` from ``mask``
+
+        The exclusion is skipped when it would leave fewer than ``keep``
+        candidates, so small catalogs and narrow segments still get a
+        full recommendation.
+        """
+        size = app.config.get('RECENT_MEALS_EXCLUDED', 0)
+        if not size:
+            return mask
+        fresh = mask
+        for meal_id in self.ring(user_id, size):
+            position = snapshot.position(meal_id)
+            if position is not None:
+                fresh &= ~(1 << position)
+        return fresh if fresh.bit_count() >= keep else mask
+
+    def add(self, user_id, meal_ids):
+        """Record meals just recommended to ``user_id``"""
+        ring = self._rings.get(user_id)
+        if ring is not None:
+            for meal_id in meal_ids:
+                ring.add(meal_id)
+
+    def stats(self):
+        return {'users': len(self._rings), 'loads': self.loads}
+
+
+recent_meals = RecentMeals()
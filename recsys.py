@@ -0,0 +1,263 @@
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select
+
+from app import app, db
+from models import MealRating
+
+# Ratings fetched per round trip while loading training data
+TRAIN_CHUNK_SIZE = 10000
+
+# Trained model versions kept on disk besides the current one
+KEEP_VERSIONS = 2
+
+POINTER_FILE = 'CURRENT'
+
+# Arrays handed to forked solver processes (inherited, never pickled)
+_SHARED = None
+
+
+def model_dir():
+    return app.config.get('RECSYS_MODEL_DIR') or os.path.join(app.instance_path, 'recsys')
+
+
+def load_ratings(chunk_size=TRAIN_CHUNK_SIZE):
+    """Stream meal_ratings into COO arrays with dense user and meal indexes"""
+    user_index = {}
+    meal_index = {}
+    users, meals, values = [], [], []
+
+    result = db.session.execute(
+        select(MealRating.user_id, MealRating.meal_id, MealRating.rating)
+        .execution_options(yield_per=chunk_size)
+    )
+    for partition in result.partitions():
+        users.append(np.fromiter(
+            (user_index.setdefault(row.user_id, len(user_index)) for row in partition),
+            dtype=np.int32, count=len(partition),
+        ))
+        meals.append(np.fromiter(
+            (meal_index.setdefault(row.meal_id, len(meal_index)) for row in partition),
+            dtype=np.int32, count=len(partition),
+        ))
+        values.append(np.fromiter((row.rating for row in partition), dtype=np.float32, count=len(partition)))
+
+    def concat(chunks, dtype):
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+
+    return (
+        list(user_index), list(meal_index),
+        concat(users, np.int32), concat(meals, np.int32), concat(values, np.float32),
+    )
+
+
+def _compress(rows, columns, values, row_count):
+    """CSR arrays for a COO matrix"""
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(row_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=row_count), out=indptr[1:])
+    return indptr, columns[order], values[order]
+
+
+def _solve_rows(bounds):
+    """Regularized least squares for one block of rows of the shared CSR matrix"""
+    start, end = bounds
+    indptr, indices, data, fixed, regularization = _SHARED
+    factors = fixed.shape[1]
+    identity = np.eye(factors, dtype=np.float64)
+    solved = np.zeros((end - start, factors), dtype=np.float32)
+    for row in range(start, end):
+        lo, hi = indptr[row], indptr[row + 1]
+        if lo == hi:
+            continue
+        other = fixed[indices[lo:hi]].astype(np.float64)
+        gram = other.T @ other + regularization * (hi - lo) * identity
+        solved[row - start] = np.linalg.solve(gram, other.T @ data[lo:hi])
+    return start, solved
+
+
+def _solve(csr, fixed, regularization, workers):
+    global _SHARED
+    indptr = csr[0]
+    row_count = len(indptr) - 1
+    block = max(1, -(-row_count // (workers * 4)))
+    blocks = [(start, min(start + block, row_count)) for start in range(0, row_count, block)]
+
+    _SHARED = (*csr, fixed, regularization)
+    try:
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                results = pool.map(_solve_rows, blocks)
+        else:
+            results = map(_solve_rows, blocks)
+        solved = np.zeros((row_count, fixed.shape[1]), dtype=np.float32)
+        for start, rows in results:
+            solved[start:start + len(rows)] = rows
+        return solved
+    finally:
+        _SHARED = None
+
+
+def train_als(users, meals, ratings, user_count, meal_count,
+              factors=32, iterations=10, regularization=0.1, workers=1, seed=0):
+    """Alternating least squares on mean-centered explicit ratings"""
+    mean = float(ratings.mean()) if len(ratings) else 0.0
+    centered = (ratings - mean).astype(np.float32)
+    by_user = _compress(users, meals, centered, user_count)
+    by_meal = _compress(meals, users, centered, meal_count)
+
+    rng = np.random.default_rng(seed)
+    user_factors = np.zeros((user_count, factors), dtype=np.float32)
+    meal_factors = (rng.standard_normal((meal_count, factors)) * 0.1).astype(np.float32)
+    rmse = 0.0
+    for iteration in range(iterations):
+        user_factors = _solve(by_user, meal_factors, regularization, workers)
+        meal_factors = _solve(by_meal, user_factors, regularization, workers)
+        predicted = np.einsum('ij,ij->i', user_factors[users], meal_factors[meals])
+        rmse = float(np.sqrt(np.mean((centered - predicted) ** 2))) if len(ratings) else 0.0
+        logging.info("ALS iteration %d/%d: rmse %.4f", iteration + 1, iterations, rmse)
+    return user_factors, meal_factors, mean, rmse
+
+
+def save_model(directory, user_ids, meal_ids, user_factors, meal_factors, meta):
+    """Write a model version and atomically point CURRENT at it
+
+    Rows are stored sorted by id so servers can binary-search the
+    memory-mapped id arrays instead of building per-process dicts.
+    """
+    version = datetime.now().strftime('%Y%m%d%H%M%S%f') + f'-{os.getpid()}'
+    path = os.path.join(directory, version)
+    os.makedirs(path)
+
+    user_order = np.argsort(np.array(user_ids, dtype=str), kind='stable')
+    meal_order = np.argsort(np.array(meal_ids, dtype=np.int64), kind='stable')
+    np.save(os.path.join(path, 'user_ids.npy'), np.array(user_ids, dtype=str)[user_order])
+    np.save(os.path.join(path, 'user_factors.npy'), user_factors[user_order])
+    np.save(os.path.join(path, 'meal_ids.npy'), np.array(meal_ids, dtype=np.int64)[meal_order])
+    np.save(os.path.join(path, 'meal_factors.npy'), meal_factors[meal_order])
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    pointer = os.path.join(directory, POINTER_FILE)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(pointer + '.tmp', pointer)
+
+    versions = sorted(name for name in os.listdir(directory)
+                      if os.path.isdir(os.path.join(directory, name)) and name != version)
+    for stale in versions[:-KEEP_VERSIONS] if KEEP_VERSIONS else versions:
+        shutil.rmtree(os.path.join(directory, stale), ignore_errors=True)
+    return version
+
+
+def train(factors=32, iterations=10, regularization=0.1, workers=1, chunk_size=TRAIN_CHUNK_SIZE):
+    """Fit the factor model from meal_ratings and publish it"""
+    user_ids, meal_ids, users, meals, ratings = load_ratings(chunk_size)
+    logging.info("Training on %d ratings from %d users over %d meals",
+                 len(ratings), len(user_ids), len(meal_ids))
+    user_factors, meal_factors, mean, rmse = train_als(
+        users, meals, ratings, len(user_ids), len(meal_ids),
+        factors=factors, iterations=iterations, regularization=regularization, workers=workers,
+    )
+    meta = {
+        'global_mean': mean,
+        'factors': factors,
+        'ratings': int(len(ratings)),
+        'rmse': rmse,
+        'trained_at': datetime.now().isoformat(),
+    }
+    directory = model_dir()
+    os.makedirs(directory, exist_ok=True)
+    version = save_model(directory, user_ids, meal_ids, user_factors, meal_factors, meta)
+    return version, meta
+
+
+class FactorModel:
+    """Memory-mapped factor matrices of one trained version"""
+
+    def __init__(self, path, version):
+        self.version = version
+        self.user_ids = np.load(os.path.join(path, 'user_ids.npy'), mmap_mode='r')
+        self.user_factors = np.load(os.path.join(path, 'user_factors.npy'), mmap_mode='r')
+        self.meal_ids = np.load(os.path.join(path, 'meal_ids.npy'), mmap_mode='r')
+        self.meal_factors = np.load(os.path.join(path, 'meal_factors.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self._meal_rows = (None, None)
+
+    def user_vector(self, user_id):
+        row = int(np.searchsorted(self.user_ids, user_id))
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return np.asarray(self.user_factors[row])
+        return None
+
+    def meal_rows(self, snapshot):
+        """Factor row for each catalog position, -1 for meals the model hasn't seen"""
+        version, rows = self._meal_rows
+        if version != snapshot.version:
+            ids = np.asarray(snapshot.meal_ids, dtype=np.int64)
+            rows = np.full(len(ids), -1, dtype=np.int64)
+            if len(self.meal_ids):
+                found = np.minimum(np.searchsorted(self.meal_ids, ids), len(self.meal_ids) - 1)
+                hit = self.meal_ids[found] == ids
+                rows[hit] = found[hit]
+            self._meal_rows = (snapshot.version, rows)
+        return rows
+
+
+class FactorStore:
+    """Serves the current trained model, picking up new versions on disk"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model = None
+        self._checked_at = None
+
+    def current(self):
+        interval = app.config.get('RECSYS_RELOAD_SECONDS', 30)
+        if self._checked_at is not None and time.monotonic() - self._checked_at < interval:
+            return self._model
+        with self._lock:
+            self._checked_at = time.monotonic()
+            directory = model_dir()
+            try:
+                with open(os.path.join(directory, POINTER_FILE)) as f:
+                    version = f.read().strip()
+            except FileNotFoundError:
+                return None
+            if self._model is None or self._model.version != version:
+                try:
+                    self._model = FactorModel(os.path.join(directory, version), version)
+                    logging.info("Loaded recommendation model %s", version)
+                except (OSError, ValueError):
+                    logging.exception("Failed to load recommendation model %s", version)
+        return self._model
+
+    def reranker(self, user_id, snapshot):
+        """Score adjustment from predicted ratings, or None without a model for the user"""
+        weight = app.config.get('RECOMMEND_CF_WEIGHT', 0.0)
+        model = self.current() if weight else None
+        vector = model.user_vector(user_id) if model is not None else None
+        if vector is None:
+            return None
+        rows = model.meal_rows(snapshot)
+
+        def rerank(positions):
+            meal_rows = rows[positions]
+            known = meal_rows >= 0
+            bonus = np.zeros(len(positions), dtype=np.float32)
+            if known.any():
+                bonus[known] = model.meal_factors[meal_rows[known]] @ vector
+            return weight * bonus
+        return rerank
+
+
+factor_store = FactorStore()
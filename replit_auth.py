@@ -14,22 +14,55 @@ from flask_dance.consumer.storage import BaseStorage
 from flask_login import LoginManager, login_user, logout_user, current_user
 from oauthlib.oauth2.rfc6749.errors import InvalidGrantError
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm import make_transient_to_detached
 from werkzeug.local import LocalProxy
 
 from app import app, db
+from data_versions import version_registry
 from models import OAuth, User
+from ttl_cache import MISSING, TTLCache
 
 login_manager = LoginManager(app)
 
 
+# Short-lived caches so a typical authenticated request makes no auth queries
+user_cache = TTLCache(maxsize=app.config.get('AUTH_CACHE_SIZE', 10000),
+                      ttl=app.config.get('AUTH_CACHE_TTL_SECONDS', 60))
+token_cache = TTLCache(maxsize=app.config.get('AUTH_CACHE_SIZE', 10000),
+                       ttl=app.config.get('AUTH_CACHE_TTL_SECONDS', 60))
+
+USER_COLUMNS = [column.key for column in User.__table__.columns]
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(user_id)
+    values = user_cache.get(user_id)
+    if values is None:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            user_cache.set(user_id, {key: getattr(user, key) for key in USER_COLUMNS})
+        return user
+
+    # Attach a copy of the cached row to this request's session without a query
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def auth_cache_stats():
+    return {'users': user_cache.stats(), 'tokens': token_cache.stats()}
 
 
 class UserSessionStorage(BaseStorage):
 
+    def _cache_key(self, blueprint):
+        return (current_user.get_id(), g.browser_session_key, blueprint.name)
+
     def get(self, blueprint):
+        key = self._cache_key(blueprint)
+        token = token_cache.get(key, MISSING)
+        if token is not MISSING:
+            return token
         try:
             token = db.session.query(OAuth).filter_by(
                 user_id=current_user.get_id(),
@@ -38,6 +71,7 @@ class UserSessionStorage(BaseStorage):
             ).one().token
         except NoResultFound:
             token = None
+        token_cache.set(key, token)
         return token
 
     def set(self, blueprint, token):
@@ -53,6 +87,7 @@ class UserSessionStorage(BaseStorage):
         new_model.token = token
         db.session.add(new_model)
         db.session.commit()
+        token_cache.set(self._cache_key(blueprint), token)
 
     def delete(self, blueprint):
         db.session.query(OAuth).filter_by(
@@ -60,6 +95,7 @@ class UserSessionStorage(BaseStorage):
             browser_session_key=g.browser_session_key,
             provider=blueprint.name).delete()
         db.session.commit()
+        token_cache.pop(self._cache_key(blueprint))
 
 
 def make_replit_blueprint():
@@ -106,6 +142,7 @@ def make_replit_blueprint():
     @replit_bp.route("/logout")
     def logout():
         del replit_bp.token
+        user_cache.pop(current_user.get_id())
         logout_user()
 
         end_session_endpoint = issuer_url + "/session/end"
@@ -126,6 +163,17 @@ def make_replit_blueprint():
     return replit_bp
 
 
+# Drop cached users once a transaction of this worker that changed them
+# commits; other workers' copies expire with the cache TTL
+@version_registry.on_change('users')
+def _invalidate_changed_users(ids):
+    if ids is None:
+        user_cache.clear()
+        return
+    for user_id in ids:
+        user_cache.pop(user_id)
+
+
 def save_user(user_claims):
     user = User()
     user.id = user_claims['sub']
@@ -180,6 +228,18 @@ def require_login(f):
     return decorated_function
 
 
+def require_admin(f):
+
+    @wraps(f)
+    @require_login
+    def decorated_function(*args, **kwargs):
+        if current_user.get_id() not in app.config.get('ADMIN_USER_IDS', ()):
+            return render_template("403.html"), 403
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
 def get_next_navigation_url(request):
     is_navigation_url = request.headers.get(
         'Sec-Fetch-Mode') == 'navigate' and request.headers.get(
@@ -1,10 +1,31 @@
 import json
-import random
-from flask import session, render_template, request, redirect, url_for, flash, jsonify
+import os
+from datetime import datetime
+from flask import session, render_template, request, redirect, url_for, flash, jsonify, stream_with_context, abort
 from flask_login import current_user
 from app import app, db
-from replit_auth import require_login, make_replit_blueprint
-from models import User, Meal, MealHistory, UserPreference, HealthTip
+from replit_auth import auth_cache_stats, require_admin, require_login, make_replit_blueprint
+from catalog import NUTRIENT_COLUMNS, catalog_index
+from data_versions import version_registry
+from segment_pools import segment_pools
+from history import history_writer, record_history
+from history_partitions import recent_history_cutoff
+from tips import tip_service
+from profiles import height_in_meters, update_derived_profile, user_profile
+from meal_payloads import RawJSON, encode_object, json_array, json_response, meal_payloads
+from ratings import MAX_BATCH_RATINGS, RatingError, clean_rating, upsert_ratings
+from scoring import rank_candidates, user_daily_targets, user_meal_targets
+from meal_plan import MealPlanError, clean_plan_request, cost_mask, plan_meals
+from meal_search import MealQueryError, export_meals, meal_page, parse_meal_query
+from batch_recommend import BatchRequestError, clean_batch_request, recommend_batch
+from recsys import factor_store
+from recent_meals import recent_meals
+from meal_stats import SORTS as MEAL_STATS_SORTS, top_meals
+from nutrition import NutritionQueryError, daily_summary, parse_summary_range
+import metrics
+from metrics import timed
+from profiler import request_profiler, write_collapsed
+from models import User, Meal, MealHistory, MealRating, UserPreference, HealthTip
 
 app.register_blueprint(make_replit_blueprint(), url_prefix="/auth")
 
@@ -15,170 +36,31 @@ def make_session_permanent():
     session.permanent = True
 
 
-def init_sample_data():
-    """Initialize sample meal data if database is empty"""
-    if Meal.query.count() == 0:
-        # Sample meals with various categories
-        sample_meals = [
-            {
-                'name': 'Mediterranean Quinoa Bowl',
-                'description': 'A nutritious bowl with quinoa, chickpeas, vegetables, and tahini dressing',
-                'calories': 420,
-                'protein': 15.0,
-                'carbs': 65.0,
-                'fat': 12.0,
-                'fiber': 8.0,
-                'age_group': 'adult',
-                'gender': 'any',
-                'weight_category': 'normal',
-                'activity_level': 'moderate',
-                'cost_level': 'medium',
-                'prep_time': 25,
-                'difficulty': 'easy',
-                'cuisine_type': 'Mediterranean',
-                'meal_type': 'lunch',
-                'ingredients': json.dumps(['quinoa', 'chickpeas', 'cucumber', 'tomatoes', 'olives', 'tahini']),
-                'instructions': 'Cook quinoa, combine with vegetables and chickpeas, dress with tahini sauce.',
-                'image_url': 'https://pixabay.com/get/gc485ff69141098792001670aa8908a669e8c41416c662a8f34401e4f3567107b4b1096d3b5e370808f42b293470c93524508e369be9382b9eac57e0ea1f3d58f_1280.jpg'
-            },
-            {
-                'name': 'Grilled Salmon with Sweet Potato',
-                'description': 'Omega-3 rich salmon with roasted sweet potato and steamed broccoli',
-                'calories': 380,
-                'protein': 25.0,
-                'carbs': 35.0,
-                'fat': 15.0,
-                'fiber': 6.0,
-                'age_group': 'adult',
-                'gender': 'any',
-                'weight_category': 'normal',
-                'activity_level': 'active',
-                'cost_level': 'high',
-                'prep_time': 30,
-                'difficulty': 'medium',
-                'cuisine_type': 'American',
-                'meal_type': 'dinner',
-                'ingredients': json.dumps(['salmon', 'sweet potato', 'broccoli', 'olive oil', 'herbs']),
-                'instructions': 'Grill salmon, roast sweet potato, steam broccoli, serve together.',
-                'image_url': 'https://pixabay.com/get/g008e64fac11596f34500b8dc58b558b4d164cff417ac1d435b00f902f314679c1c2a5e0f2ea0174ecfc3c884f56d038a6443ed0385d915895af3504c54bbf6c0_1280.jpg'
-            },
-            {
-                'name': 'Avocado Toast with Eggs',
-                'description': 'Whole grain toast topped with mashed avocado and poached eggs',
-                'calories': 320,
-                'protein': 14.0,
-                'carbs': 28.0,
-                'fat': 18.0,
-                'fiber': 10.0,
-                'age_group': 'young',
-                'gender': 'any',
-                'weight_category': 'underweight',
-                'activity_level': 'light',
-                'cost_level': 'medium',
-                'prep_time': 15,
-                'difficulty': 'easy',
-                'cuisine_type': 'Modern',
-                'meal_type': 'breakfast',
-                'ingredients': json.dumps(['whole grain bread', 'avocado', 'eggs', 'lemon', 'salt', 'pepper']),
-                'instructions': 'Toast bread, mash avocado with seasonings, poach eggs, assemble.',
-                'image_url': 'https://pixabay.com/get/g9bc1c67b627f6d7a7fe8d30af048b1b84d00854fe214b2c7f6e90adad223d3cce6a981ad03d48dee4227ffbd3b90933589c43b1d80802f423317f305f8e49d13_1280.jpg'
-            },
-            {
-                'name': 'Lentil Vegetable Soup',
-                'description': 'Hearty soup with red lentils, carrots, celery, and spices',
-                'calories': 280,
-                'protein': 18.0,
-                'carbs': 45.0,
-                'fat': 3.0,
-                'fiber': 12.0,
-                'age_group': 'senior',
-                'gender': 'any',
-                'weight_category': 'overweight',
-                'activity_level': 'sedentary',
-                'cost_level': 'low',
-                'prep_time': 45,
-                'difficulty': 'easy',
-                'cuisine_type': 'Indian',
-                'meal_type': 'dinner',
-                'ingredients': json.dumps(['red lentils', 'carrots', 'celery', 'onions', 'garlic', 'spices']),
-                'instructions': 'Sauté vegetables, add lentils and broth, simmer until tender.',
-                'image_url': 'https://pixabay.com/get/g4196686dc7f9d9dac565724fcccd6504372c00d1245a9da6f40723a60cbfb2b7c84e495555b377c13fede39219e3578c953e508daa9f12d1f086179133a17169_1280.jpg'
-            },
-            {
-                'name': 'Greek Yogurt Berry Parfait',
-                'description': 'Layered parfait with Greek yogurt, mixed berries, and granola',
-                'calories': 250,
-                'protein': 20.0,
-                'carbs': 35.0,
-                'fat': 6.0,
-                'fiber': 5.0,
-                'age_group': 'young',
-                'gender': 'female',
-                'weight_category': 'normal',
-                'activity_level': 'moderate',
-                'cost_level': 'medium',
-                'prep_time': 5,
-                'difficulty': 'easy',
-                'cuisine_type': 'Greek',
-                'meal_type': 'breakfast',
-                'ingredients': json.dumps(['Greek yogurt', 'mixed berries', 'granola', 'honey']),
-                'instructions': 'Layer yogurt, berries, and granola in a glass or bowl.',
-                'image_url': 'https://pixabay.com/get/gda5b6fcc1e5201bd24cb92571c7bb063c6c0b65e817fd4e8177df00bbc398809d7085a3c858dad01ba370e68853bfdeb84d3c25425ca87114327d6284fc64211_1280.jpg'
-            },
-            {
-                'name': 'Chicken Stir Fry',
-                'description': 'Quick and healthy stir fry with chicken breast and mixed vegetables',
-                'calories': 350,
-                'protein': 28.0,
-                'carbs': 25.0,
-                'fat': 12.0,
-                'fiber': 4.0,
-                'age_group': 'adult',
-                'gender': 'male',
-                'weight_category': 'normal',
-                'activity_level': 'active',
-                'cost_level': 'medium',
-                'prep_time': 20,
-                'difficulty': 'medium',
-                'cuisine_type': 'Asian',
-                'meal_type': 'dinner',
-                'ingredients': json.dumps(['chicken breast', 'bell peppers', 'broccoli', 'carrots', 'soy sauce', 'ginger']),
-                'instructions': 'Cut chicken and vegetables, stir fry in wok with seasonings.',
-                'image_url': 'https://pixabay.com/get/g8e6fa1b44609075f4a6ca63e098a141f95759229602d04e8f8b88962aa10203f9f9f64656f060cdb42133a2d49ccfab56f29f60821fbbd097b0441be35aeb903_1280.jpg'
-            }
-        ]
-        
-        for meal_data in sample_meals:
-            meal = Meal(**meal_data)
-            db.session.add(meal)
-        
-        # Sample health tips
-        sample_tips = [
-            {
-                'title': 'Stay Hydrated',
-                'content': 'Drink at least 8 glasses of water daily to maintain optimal health and support your metabolism.',
-                'category': 'nutrition',
-                'target_demographic': 'all'
-            },
-            {
-                'title': 'Eat the Rainbow',
-                'content': 'Include colorful fruits and vegetables in your diet to ensure you get a variety of vitamins and antioxidants.',
-                'category': 'nutrition',
-                'target_demographic': 'all'
-            },
-            {
-                'title': 'Portion Control',
-                'content': 'Use smaller plates and bowls to help control portion sizes and prevent overeating.',
-                'category': 'nutrition',
-                'target_demographic': 'weight_loss'
-            }
-        ]
-        
-        for tip_data in sample_tips:
-            tip = HealthTip(**tip_data)
-            db.session.add(tip)
-        
-        db.session.commit()
+@app.before_request
+def start_background_workers():
+    segment_pools.ensure_worker(app)
+    history_writer.ensure_worker(app)
+    version_registry.ensure_worker(app)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Request, SQL and cache metrics in the Prometheus text format"""
+    token = app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+    auth_stats = auth_cache_stats()
+    body = metrics.render({
+        'segment_pools': segment_pools.stats(),
+        'history_writer': history_writer.stats(),
+        'auth_user_cache': auth_stats['users'],
+        'auth_token_cache': auth_stats['tokens'],
+        'meal_payloads': meal_payloads.stats(),
+        'tips': {'loads': tip_service.loads},
+        'data_versions': version_registry.stats(),
+        'recent_meals': recent_meals.stats(),
+    })
+    return app.response_class(body, mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/')
@@ -193,15 +75,20 @@ def index():
 @require_login
 def home():
     """Home page for authenticated users"""
-    init_sample_data()  # Initialize sample data if needed
-    
-    # Get user's recent meal history
-    recent_meals = db.session.query(MealHistory, Meal).join(Meal).filter(
-        MealHistory.user_id == current_user.id
+    # Get user's recent meal history with any rating they gave
+    recent_meals = db.session.query(MealHistory, Meal, MealRating.rating).select_from(
+        MealHistory
+    ).join(Meal, Meal.id == MealHistory.meal_id).outerjoin(
+        MealRating,
+        (MealRating.user_id == MealHistory.user_id) & (MealRating.meal_id == MealHistory.meal_id),
+    ).filter(
+        MealHistory.user_id == current_user.id,
+        MealHistory.created_at >= recent_history_cutoff(),
     ).order_by(MealHistory.created_at.desc()).limit(3).all()
     
     # Get a random health tip
-    health_tip = HealthTip.query.filter_by(is_active=True).order_by(db.func.random()).first()
+    health_tips = tip_service.sample(1, health_goal=current_user.health_goals)
+    health_tip = health_tips[0] if health_tips else None
     
     return render_template('home.html', recent_meals=recent_meals, health_tip=health_tip)
 
@@ -214,7 +101,7 @@ def profile():
         # Update user profile
         current_user.age = request.form.get('age', type=int)
         current_user.weight = request.form.get('weight', type=float)
-        current_user.height = request.form.get('height', type=float)
+        current_user.height = height_in_meters(request.form.get('height', type=float))
         current_user.gender = request.form.get('gender')
         current_user.activity_level = request.form.get('activity_level')
         current_user.health_goals = request.form.get('health_goals')
@@ -227,6 +114,9 @@ def profile():
         allergies = [allergy.strip() for allergy in allergies if allergy.strip()]
         current_user.allergies = json.dumps(allergies)
         
+        # Store the derived classification used by the recommender
+        update_derived_profile(current_user)
+        
         db.session.commit()
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
@@ -264,109 +154,45 @@ def recommendations():
 def api_recommend():
     """API endpoint for meal recommendations"""
     try:
-        # Get user preferences or use defaults
-        age = current_user.age or 25
-        weight = current_user.weight or 70
-        gender = current_user.gender or 'any'
-        activity_level = current_user.activity_level or 'moderate'
-        
-        # Classify user into categories
-        if age < 25:
-            age_group = 'young'
-        elif age >= 65:
-            age_group = 'senior'
-        else:
-            age_group = 'adult'
-        
-        # Weight category classification (simplified BMI logic)
-        height = current_user.height or 1.7  # default height in meters
-        bmi = weight / (height ** 2)
-        if bmi < 18.5:
-            weight_category = 'underweight'
-        elif bmi > 25:
-            weight_category = 'overweight'
-        else:
-            weight_category = 'normal'
-        
-        # Build query for meal recommendations
-        query = Meal.query
-        
-        # Apply filters based on user profile
-        query = query.filter(
-            (Meal.age_group == age_group) | (Meal.age_group == 'any')
-        )
-        query = query.filter(
-            (Meal.gender == gender) | (Meal.gender == 'any')
-        )
-        query = query.filter(
-            (Meal.weight_category == weight_category) | (Meal.weight_category == 'any')
-        )
-        query = query.filter(
-            (Meal.activity_level == activity_level) | (Meal.activity_level == 'any')
-        )
-        
-        # Get user's allergies
-        user_allergies = []
-        if current_user.allergies:
-            try:
-                user_allergies = json.loads(current_user.allergies)
-            except json.JSONDecodeError:
-                pass
-        
-        # Filter out meals with allergens (simplified check)
-        if user_allergies:
-            for allergy in user_allergies:
-                query = query.filter(~Meal.ingredients.contains(allergy.lower()))
-        
-        # Get meal recommendations
-        available_meals = query.all()
-        
-        if not available_meals:
-            # Fallback to any available meals
-            available_meals = Meal.query.limit(5).all()
-        
-        # Select random meals
-        recommended_meals = random.sample(available_meals, min(3, len(available_meals)))
-        
-        # Format response
-        meals_data = []
-        for meal in recommended_meals:
-            ingredients_list = []
-            try:
-                ingredients_list = json.loads(meal.ingredients or '[]')
-            except json.JSONDecodeError:
-                pass
+        with timed('candidates'):
+            # Read the classification stored at profile save
+            profile = user_profile(current_user)
+            
+            # Look up the precomputed candidate pool for the user's segment
+            catalog = catalog_index.snapshot()
+            candidates = segment_pools.get(
+                catalog,
+                (profile.age_group, profile.gender, profile.weight_category, profile.activity_level),
+            )
             
-            # Generate affiliate links (simplified)
-            affiliate_links = []
-            for ingredient in ingredients_list[:3]:  # First 3 ingredients
-                affiliate_links.append({
-                    'ingredient': ingredient.title(),
-                    'url': f'https://example-grocery.com/search?q={ingredient}',
-                    'store': 'Sample Grocery'
-                })
+            # Filter out meals with allergens via the ingredient posting lists
+            candidates = catalog.exclude_allergens(candidates, profile.allergies)
             
-            meals_data.append({
-                'id': meal.id,
-                'name': meal.name,
-                'description': meal.description,
-                'calories': meal.calories,
-                'protein': meal.protein,
-                'carbs': meal.carbs,
-                'fat': meal.fat,
-                'fiber': meal.fiber,
-                'prep_time': meal.prep_time,
-                'difficulty': meal.difficulty,
-                'cuisine_type': meal.cuisine_type,
-                'meal_type': meal.meal_type,
-                'ingredients': ingredients_list,
-                'instructions': meal.instructions,
-                'image_url': meal.image_url,
-                'affiliate_links': affiliate_links
-            })
+            if not candidates:
+                # Fallback to any available allergen-free meals
+                candidates = catalog.exclude_allergens(catalog.all_mask, profile.allergies)
+            
+            # Skip meals this user was recommended recently
+            candidates = recent_meals.exclude(catalog, current_user.id, candidates, keep=3)
+        
+        with timed('ranking'):
+            # Rank candidates against the user's per-meal nutrient targets,
+            # adjusted by ratings predicted from the collaborative model
+            selected_ids = rank_candidates(
+                catalog,
+                candidates,
+                user_meal_targets(current_user),
+                k=3,
+                jitter=app.config['RECOMMEND_SCORE_JITTER'],
+                rerank=factor_store.reranker(current_user.id, catalog),
+            )
+        
+        with timed('payloads'):
+            # Splice in the pre-encoded payloads of the selected meals
+            meal_fragments = meal_payloads.fragments(selected_ids)
         
         # Get health tips
-        health_tips = HealthTip.query.filter_by(is_active=True).order_by(db.func.random()).limit(2).all()
+        health_tips = tip_service.sample(2, health_goal=current_user.health_goals)
         tips_data = []
         for tip in health_tips:
             tips_data.append({
@@ -375,24 +201,135 @@ def api_recommend():
                 'category': tip.category
             })
         
-        # Save recommendation to history
-        for meal in recommended_meals:
-            history = MealHistory(
-                user_id=current_user.id,
-                meal_id=meal.id
-            )
-            db.session.add(history)
-        db.session.commit()
+        with timed('history'):
+            # Save recommendation to history
+            recommended_at = datetime.now()
+            recent_meals.add(current_user.id, selected_ids)
+            record_history([
+                {'user_id': current_user.id, 'meal_id': meal_id, 'created_at': recommended_at}
+                for meal_id in selected_ids
+            ])
+        
+        with timed('serialize'):
+            return json_response({
+                'success': True,
+                'meals': json_array(meal_fragments),
+                'health_tips': tips_data,
+                'user_profile': {
+                    'age_group': profile.age_group,
+                    'weight_category': profile.weight_category,
+                    'activity_level': profile.activity_level
+                }
+            })
         
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/nutrition_summary')
+@require_login
+def api_nutrition_summary():
+    """Daily calories and macros of the meals recommended to the user, from the daily rollup"""
+    try:
+        start, end = parse_summary_range(request.args)
+    except NutritionQueryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    days = daily_summary(current_user.id, start, end)
+    totals = {column: round(sum(getattr(day, column) for day in days), 1) for column in NUTRIENT_COLUMNS}
+    return jsonify({
+        'success': True,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'days': [{
+            'date': day.day.isoformat(),
+            'meals': day.meals,
+            **{column: round(getattr(day, column), 1) for column in NUTRIENT_COLUMNS},
+        } for day in days],
+        'totals': {'meals': sum(day.meals for day in days), **totals},
+    })
+
+
+@app.route('/api/meals')
+@require_login
+def api_meals():
+    """Browse and search the catalog, a keyset page at a time or as an NDJSON export"""
+    try:
+        query = parse_meal_query(request.args)
+    except MealQueryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if request.args.get('format') == 'ndjson':
+        return app.response_class(
+            stream_with_context(export_meals(query)),
+            mimetype='application/x-ndjson',
+        )
+    
+    try:
+        meal_ids, next_cursor = meal_page(query)
+        return json_response({
             'success': True,
-            'meals': meals_data,
-            'health_tips': tips_data,
-            'user_profile': {
-                'age_group': age_group,
-                'weight_category': weight_category,
-                'activity_level': activity_level
-            }
+            'meals': json_array(meal_payloads.fragments(meal_ids)),
+            'next_cursor': next_cursor,
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/meal_plan', methods=['POST'])
+@require_login
+def api_meal_plan():
+    """Breakfast, lunch, dinner and snack for each day, close to the daily calorie target"""
+    try:
+        try:
+            days, max_cost = clean_plan_request(request.get_json(silent=True))
+        except MealPlanError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        profile = user_profile(current_user)
+        catalog = catalog_index.snapshot()
+        candidates = segment_pools.get(
+            catalog,
+            (profile.age_group, profile.gender, profile.weight_category, profile.activity_level),
+        )
+        candidates = catalog.exclude_allergens(candidates, profile.allergies) & cost_mask(catalog, max_cost)
+        
+        if not candidates:
+            # Fallback to any affordable allergen-free meals
+            candidates = catalog.exclude_allergens(cost_mask(catalog, max_cost), profile.allergies)
+        
+        targets = user_daily_targets(current_user)
+        plan, searched = plan_meals(
+            catalog,
+            candidates,
+            targets,
+            days,
+            rerank=factor_store.reranker(current_user.id, catalog),
+        )
+        
+        fragments = meal_payloads.fragment_map(
+            {catalog.meal_id(position) for day in plan for _, position in day}
+        )
+        plan_days = []
+        for number, day in enumerate(plan, 1):
+            meals = [(slot, catalog.meal_id(position)) for slot, position in day]
+            plan_days.append(encode_object({
+                'day': number,
+                'calories': round(float(sum(catalog.nutrients[position, 0] for _, position in day))),
+                'meals': json_array(
+                    encode_object({'slot': slot, 'meal': RawJSON(fragments[meal_id])})
+                    for slot, meal_id in meals if meal_id in fragments
+                ),
+            }))
+        
+        return json_response({
+            'success': True,
+            'calorie_target': round(float(targets[0])),
+            'complete_search': searched,
+            'days': json_array(plan_days),
         })
         
     except Exception as e:
@@ -402,40 +339,123 @@ def api_recommend():
         }), 500
 
 
+@app.route('/api/admin/recommend_batch', methods=['POST'])
+@require_admin
+def admin_recommend_batch():
+    """Stream recommendations for many users, or one user over several days, as NDJSON"""
+    try:
+        user_ids, days = clean_batch_request(request.get_json(silent=True))
+    except BatchRequestError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return app.response_class(
+        stream_with_context(recommend_batch(user_ids, days=days)),
+        mimetype='application/x-ndjson',
+    )
+
+
+@app.route('/api/admin/meal_stats')
+@require_admin
+def admin_meal_stats():
+    """Most recommended or best rated meals, read from the meal_stats rollup"""
+    sort = request.args.get('sort', 'recommendations')
+    if sort not in MEAL_STATS_SORTS:
+        return jsonify({'success': False, 'error': f"sort must be one of {', '.join(MEAL_STATS_SORTS)}"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        min_ratings = int(request.args.get('min_ratings', 5))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit and min_ratings must be integers'}), 400
+    
+    rows = top_meals(sort, limit=limit, min_ratings=min_ratings)
+    return jsonify({
+        'success': True,
+        'meals': [{
+            'meal_id': row.meal_id,
+            'name': row.name,
+            'recommendations': row.recommendations,
+            'last_recommended_at': row.last_recommended_at.isoformat() if row.last_recommended_at else None,
+            'rating_count': row.rating_count,
+            'average_rating': round(row.average_rating, 2) if row.average_rating is not None else None,
+        } for row in rows],
+    })
+
+
+@app.route('/admin/profile')
+@require_admin
+def admin_profiles():
+    """Routes with profiling samples"""
+    return jsonify({
+        'routes': request_profiler.routes(),
+        'samples': request_profiler.samples,
+        'dropped': request_profiler.dropped,
+    })
+
+
+@app.route('/admin/profile/<route>')
+@require_admin
+def admin_profile(route):
+    """Collapsed stacks for one route, ready for flamegraph.pl or speedscope"""
+    if route not in request_profiler.routes():
+        return jsonify({'success': False, 'error': f'No samples for {route}'}), 404
+    
+    directory = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+    path = write_collapsed(route, directory)
+    body = request_profiler.collapsed(route)
+    if request.args.get('reset'):
+        request_profiler.reset(route)
+    
+    response = app.response_class(body, mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'inline; filename="{os.path.basename(path)}"'
+    return response
+
+
 @app.route('/api/rate_meal', methods=['POST'])
 @require_login
 def rate_meal():
     """Rate a meal"""
     try:
         data = request.get_json()
-        meal_id = data.get('meal_id')
-        rating = data.get('rating')
-        notes = data.get('notes', '')
         
-        if not meal_id or not rating:
-            return jsonify({'success': False, 'error': 'Missing required fields'}), 400
+        try:
+            rating = clean_rating(data)
+        except RatingError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        # Find existing history entry or create new one
-        history = MealHistory.query.filter_by(
-            user_id=current_user.id,
-            meal_id=meal_id
-        ).first()
+        upsert_ratings(current_user.id, [rating])
+        db.session.commit()
         
-        if history:
-            history.rating = rating
-            history.notes = notes
-        else:
-            history = MealHistory(
-                user_id=current_user.id,
-                meal_id=meal_id,
-                rating=rating,
-                notes=notes
-            )
-            db.session.add(history)
+        return jsonify({'success': True})
         
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/rate_meals', methods=['POST'])
+@require_login
+def rate_meals():
+    """Apply a batch of ratings in a single transaction"""
+    try:
+        data = request.get_json()
+        items = data.get('ratings') if isinstance(data, dict) else data
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'success': False, 'error': 'Expected a list of ratings'}), 400
+        if len(items) > MAX_BATCH_RATINGS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {MAX_BATCH_RATINGS} ratings per request'
+            }), 400
+        
+        try:
+            ratings = [clean_rating(item) for item in items]
+        except RatingError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        upsert_ratings(current_user.id, ratings)
         db.session.commit()
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'count': len(ratings)})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
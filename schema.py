@@ -0,0 +1,116 @@
+import logging
+
+from sqlalchemy import inspect, text
+
+from app import db
+from history_partitions import upgrade_history_partitions
+
+# Full-text search over meal name, description and ingredients; kept in
+# sync by the database itself (a generated column or triggers)
+POSTGRESQL_SEARCH_DDL = (
+    "ALTER TABLE meals ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, '') || ' ' "
+    "|| coalesce(ingredients, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_meals_search_vector ON meals USING GIN (search_vector)",
+)
+SQLITE_SEARCH_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS meals_fts USING fts5("
+    "name, description, ingredients, content='meals', content_rowid='id', tokenize='porter unicode61')"
+)
+SQLITE_SEARCH_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS meals_fts_ai AFTER INSERT ON meals BEGIN "
+    "INSERT INTO meals_fts(rowid, name, description, ingredients) "
+    "VALUES (new.id, new.name, new.description, new.ingredients); END",
+    "CREATE TRIGGER IF NOT EXISTS meals_fts_ad AFTER DELETE ON meals BEGIN "
+    "INSERT INTO meals_fts(meals_fts, rowid, name, description, ingredients) "
+    "VALUES ('delete', old.id, old.name, old.description, old.ingredients); END",
+    "CREATE TRIGGER IF NOT EXISTS meals_fts_au AFTER UPDATE OF name, description, ingredients ON meals BEGIN "
+    "INSERT INTO meals_fts(meals_fts, rowid, name, description, ingredients) "
+    "VALUES ('delete', old.id, old.name, old.description, old.ingredients); "
+    "INSERT INTO meals_fts(rowid, name, description, ingredients) "
+    "VALUES (new.id, new.name, new.description, new.ingredients); END",
+)
+
+
+def upgrade_search_index(connection):
+    """Create the meal full-text index for the connection's dialect"""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        for statement in POSTGRESQL_SEARCH_DDL:
+            connection.execute(text(statement))
+    elif dialect == 'sqlite':
+        # The triggers go away with the meals table, so missing triggers
+        # mean the index may hold rows of a dropped table: rebuild it
+        rebuild = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'meals_fts_ai'"
+        )).first() is None
+        connection.execute(text(SQLITE_SEARCH_TABLE))
+        for statement in SQLITE_SEARCH_TRIGGERS:
+            connection.execute(text(statement))
+        if rebuild:
+            connection.execute(text("INSERT INTO meals_fts(meals_fts) VALUES ('rebuild')"))
+            logging.info("Built the meal search index")
+
+
+# Indexes no query uses any more, dropped from existing databases
+OBSOLETE_INDEXES = (
+    'ix_meal_history_user_meal',  # rating lookups moved to meal_ratings
+)
+
+# Natural keys the catalog import upserts on, which older releases didn't keep unique
+CATALOG_KEYS = {'meals': 'name', 'health_tips': 'title'}
+
+
+def rename_duplicate_keys(connection, table, column):
+    """Make ``column`` unique before its unique index is created
+
+    All but the oldest row of each duplicate get their id appended, so
+    history and ratings pointing at them stay valid; merge them by hand
+    if they are true copies.
+    """
+    renamed = connection.execute(text(
+        f"UPDATE {table} SET {column} = {column} || ' #' || id WHERE id NOT IN "
+        f"(SELECT min(id) FROM {table} GROUP BY {column})"
+    )).rowcount
+    if renamed:
+        logging.warning("Renamed %d %s rows with a duplicate %s", renamed, table, column)
+
+
+def upgrade_schema():
+    """Bring tables created by an older release up to the current models
+
+    db.create_all() only creates missing tables, so columns and indexes
+    added to existing tables later are applied here. New columns must be
+    nullable.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(
+                        f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                    ))
+                    logging.info("Added column %s.%s", table.name, column.name)
+
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    if index.unique and table.name in CATALOG_KEYS:
+                        rename_duplicate_keys(connection, table.name, CATALOG_KEYS[table.name])
+                    index.create(connection)
+                    logging.info("Created index %s", index.name)
+
+        for name in OBSOLETE_INDEXES:
+            connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+
+        upgrade_search_index(connection)
+        upgrade_history_partitions(connection)
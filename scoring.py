@@ -0,0 +1,185 @@
+import numpy as np
+
+from catalog import NUTRIENT_COLUMNS
+from profiles import DEFAULT_AGE, DEFAULT_HEIGHT, DEFAULT_WEIGHT
+
+# Physical activity multipliers applied to BMR to estimate TDEE
+ACTIVITY_FACTORS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'active': 1.725,
+}
+
+# Daily calorie adjustment per health goal
+GOAL_CALORIE_DELTA = {
+    'weight_loss': -500,
+    'weight_gain': 300,
+    'muscle_gain': 250,
+}
+
+# Share of daily calories from protein, carbs and fat
+DEFAULT_MACRO_SPLIT = (0.20, 0.50, 0.30)
+GOAL_MACRO_SPLIT = {
+    'muscle_gain': (0.30, 0.45, 0.25),
+    'diabetes_management': (0.25, 0.40, 0.35),
+}
+
+# Relative importance of each nutrient's deviation from target
+NUTRIENT_WEIGHTS = np.array([1.0, 0.6, 0.3, 0.3, 0.2], dtype=np.float32)
+
+# Recommendations cover one of this many main meals per day
+MEALS_PER_DAY = 3
+
+
+def daily_targets(age, weight, height, gender, activity_level, health_goal=None):
+    """Daily calorie, macro (g) and fiber (g) targets from a BMR/TDEE estimate"""
+    age = age or DEFAULT_AGE
+    weight = weight or DEFAULT_WEIGHT
+    height = height or DEFAULT_HEIGHT
+
+    # Mifflin-St Jeor; the midpoint constant covers unspecified gender
+    bmr = 10 * weight + 6.25 * height * 100 - 5 * age
+    bmr += {'male': 5, 'female': -161}.get(gender, -78)
+    calories = bmr * ACTIVITY_FACTORS.get(activity_level, ACTIVITY_FACTORS['moderate'])
+    calories = max(calories + GOAL_CALORIE_DELTA.get(health_goal, 0), 1200)
+
+    protein, carbs, fat = GOAL_MACRO_SPLIT.get(health_goal, DEFAULT_MACRO_SPLIT)
+    return np.array([
+        calories,
+        calories * protein / 4,
+        calories * carbs / 4,
+        calories * fat / 9,
+        calories * 14 / 1000,
+    ], dtype=np.float32)
+
+
+def user_daily_targets(user):
+    """Daily nutrient targets for ``user``"""
+    return daily_targets(
+        user.age, user.weight, user.height, user.gender, user.activity_level, user.health_goals
+    )
+
+
+def user_meal_targets(user):
+    """Per-meal nutrient targets for ``user``"""
+    return user_daily_targets(user) / MEALS_PER_DAY
+
+
+# Candidates kept for the randomized tie-break, per requested meal
+SHORTLIST_FACTOR = 4
+
+# Content-ranked candidates passed to a reranker such as the factor model
+RERANK_SHORTLIST = 200
+
+# Above this share of the catalog, score everything instead of gathering
+DENSE_CANDIDATE_SHARE = 0.25
+
+# Most user x candidate scores held at once when ranking for many users
+SCORE_BLOCK_ELEMENTS = 4_000_000
+
+
+def score_coefficients(targets):
+    """Coefficients turning snapshot nutrient features into scores
+
+    The weighted squared relative distance sum(w * (x / t - 1) ** 2)
+    expands to x**2 . (w / t**2) - x . (2w / t) + sum(w), so scoring is a
+    single product with the (squares, values) feature rows.
+    """
+    return np.concatenate([
+        -NUTRIENT_WEIGHTS / (targets * targets),
+        2 * NUTRIENT_WEIGHTS / targets,
+    ], axis=-1).astype(np.float32)
+
+
+def score_meals(features, targets):
+    """Scores for feature columns; higher is better and 0 is exactly on target
+
+    With a (users, 5) ``targets`` matrix this returns one row per user.
+    """
+    return score_coefficients(targets) @ features - NUTRIENT_WEIGHTS.sum()
+
+
+def top_k(scores, k, jitter=0.0, rng=None):
+    """Indices of the ``k`` best scores, best first
+
+    With ``jitter``, uniform noise of that magnitude is added to the best
+    ``k * SHORTLIST_FACTOR`` scores before the final pick, which breaks
+    ties randomly and rotates near-equal meals between calls.
+    """
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    shortlist = best_indices(scores, k * SHORTLIST_FACTOR if jitter else k)
+    shortlisted = scores[shortlist]
+    if jitter:
+        rng = rng or np.random.default_rng()
+        shortlisted = shortlisted + rng.random(len(shortlist), dtype=np.float32) * jitter
+    order = np.argsort(-shortlisted)[:k]
+    return shortlist[order]
+
+
+def best_indices(scores, m):
+    if m >= len(scores):
+        return np.arange(len(scores))
+    return np.argpartition(scores, len(scores) - m)[-m:]
+
+
+def shortlist(snapshot, mask, targets, m):
+    """Positions and scores of the (up to) ``m`` best candidates in ``mask``"""
+    size = len(snapshot)
+    count = mask.bit_count()
+
+    if count > size * DENSE_CANDIDATE_SHARE:
+        # Score the whole catalog, then keep the best that are candidates
+        scores = score_meals(snapshot.nutrient_features, targets)
+        positions = best_indices(scores, m * 4)
+        positions = positions[snapshot.member_array(mask)[positions]]
+        if len(positions) >= min(m, count):
+            scores = scores[positions]
+            keep = best_indices(scores, m)
+            return positions[keep], scores[keep]
+
+    positions = snapshot.position_array(mask)
+    scores = score_meals(snapshot.nutrient_features[:, positions], targets)
+    keep = best_indices(scores, m)
+    return positions[keep], scores[keep]
+
+
+def rank_candidates(snapshot, mask, targets, k, jitter=0.0, rerank=None):
+    """Meal ids of the ``k`` candidates in ``mask`` closest to ``targets``
+
+    ``rerank(positions)`` may return extra score for the best
+    RERANK_SHORTLIST candidates before the final pick.
+    """
+    positions, scores = shortlist(
+        snapshot, mask, targets, max(RERANK_SHORTLIST, k) if rerank else k * SHORTLIST_FACTOR
+    )
+    if rerank is not None:
+        scores = scores + rerank(positions)
+    best = positions[top_k(scores, k, jitter)]
+    return snapshot.meal_ids[best].tolist()
+
+
+def rank_candidates_many(snapshot, mask, targets, k, jitter=0.0, reranks=None):
+    """Like rank_candidates() for every row of a (users, 5) ``targets`` matrix
+
+    The candidates' features are gathered once and scored for a block of
+    users with a single matrix product. ``reranks`` holds an optional
+    reranker per row.
+    """
+    positions = snapshot.position_array(mask)
+    features = np.ascontiguousarray(snapshot.nutrient_features[:, positions])
+    block = max(1, SCORE_BLOCK_ELEMENTS // max(len(positions), 1))
+    results = []
+    for start in range(0, len(targets), block):
+        scores = score_meals(features, targets[start:start + block])
+        for offset, row in enumerate(scores):
+            rerank = reranks[start + offset] if reranks else None
+            keep = best_indices(row, max(RERANK_SHORTLIST, k) if rerank else k * SHORTLIST_FACTOR)
+            shortlisted, shortlist_scores = positions[keep], row[keep]
+            if rerank is not None:
+                shortlist_scores = shortlist_scores + rerank(shortlisted)
+            best = shortlisted[top_k(shortlist_scores, k, jitter)]
+            results.append(snapshot.meal_ids[best].tolist())
+    return results
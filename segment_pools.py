@@ -0,0 +1,121 @@
+import itertools
+import logging
+import os
+import threading
+import time
+
+from catalog import CLASSIFICATION_COLUMNS, catalog_index
+
+# Every value a user can be classified into, per classification column
+SEGMENT_VALUES = {
+    'age_group': ('young', 'adult', 'senior'),
+    'gender': ('male', 'female', 'other', 'any'),
+    'weight_category': ('underweight', 'normal', 'overweight'),
+    'activity_level': ('sedentary', 'light', 'moderate', 'active'),
+}
+
+# How often the worker checks for a new catalog version, in seconds
+POLL_INTERVAL = 1.0
+
+
+def all_segments():
+    """Every classification segment as a tuple in CLASSIFICATION_COLUMNS order"""
+    return list(itertools.product(*(SEGMENT_VALUES[column] for column in CLASSIFICATION_COLUMNS)))
+
+
+class SegmentPool:
+    """Eligible meals for one segment at one catalog version"""
+
+    def __init__(self, version, mask):
+        self.version = version
+        self.mask = mask
+
+
+class SegmentPoolCache:
+    """Per-segment candidate pools, materialized by a background worker.
+
+    Requests only look pools up; a pool built for an older catalog version
+    is never served, it is recomputed on the spot and counted as stale.
+    """
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.refreshes = 0
+        self.refreshed_version = None
+        self.refreshed_at = None
+
+    def get(self, snapshot, segment):
+        """Candidate bitset for ``segment`` against ``snapshot``"""
+        pool = self._pools.get(segment)
+        if pool is not None and pool.version == snapshot.version:
+            self.hits += 1
+            return pool.mask
+
+        if pool is None:
+            self.misses += 1
+        else:
+            self.stale += 1
+        mask = snapshot.segment_mask(**dict(zip(CLASSIFICATION_COLUMNS, segment)))
+        self._pools[segment] = SegmentPool(snapshot.version, mask)
+        return mask
+
+    def refresh(self):
+        """Rebuild every segment's pool from the current catalog snapshot"""
+        snapshot = catalog_index.snapshot()
+        pools = {}
+        for segment in all_segments():
+            mask = snapshot.segment_mask(**dict(zip(CLASSIFICATION_COLUMNS, segment)))
+            pools[segment] = SegmentPool(snapshot.version, mask)
+        self._pools = pools
+        self.refreshes += 1
+        self.refreshed_version = snapshot.version
+        self.refreshed_at = time.time()
+        logging.info("Refreshed %d segment pools (catalog version %d)", len(pools), snapshot.version)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.stale
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'refreshes': self.refreshes,
+            'pools': len(self._pools),
+            'catalog_version': catalog_index.version,
+            'pool_version': self.refreshed_version,
+            'age_seconds': time.time() - self.refreshed_at if self.refreshed_at else None,
+        }
+
+    def ensure_worker(self, app):
+        """Start the refresh worker once per process"""
+        interval = app.config.get('SEGMENT_POOL_REFRESH_SECONDS', 0)
+        if interval <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, args=(app, interval), name='segment-pools', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, app, interval):
+        while True:
+            try:
+                with app.app_context():
+                    due = self.refreshed_at is None or time.time() - self.refreshed_at >= interval
+                    if due or self.refreshed_version != catalog_index.version:
+                        self.refresh()
+            except Exception:
+                logging.exception("Segment pool refresh failed")
+            time.sleep(POLL_INTERVAL)
+
+
+segment_pools = SegmentPoolCache()
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+import pytest
+
+# app.py creates and seeds the database when it is imported, so point it
+# at a scratch directory before any test module imports it
+_scratch = tempfile.mkdtemp(prefix='nutriguide-tests-')
+os.environ.setdefault('REPL_ID', 'test')
+os.environ.setdefault('SESSION_SECRET', 'test')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_scratch, 'test.db')
+os.environ['CATALOG_SNAPSHOT_DIR'] = os.path.join(_scratch, 'catalog')
+
+
+@pytest.fixture
+def app_context():
+    from app import app
+    with app.app_context():
+        yield app
@@ -0,0 +1,22 @@
+from app import db
+from models import User
+from profiles import convert_legacy_heights
+from scoring import MEALS_PER_DAY, user_meal_targets
+
+
+def test_legacy_centimeter_height_is_converted(app_context):
+    # Saved before heights were normalized: centimeters and the derived
+    # values computed from them
+    db.session.add(User(
+        id='legacy-cm', age=30, weight=70.0, height=175.0, gender='male', activity_level='moderate',
+        segment_key='adult|male|underweight|moderate', bmi=0.0,
+    ))
+    db.session.commit()
+
+    assert convert_legacy_heights() == 1
+    user = db.session.get(User, 'legacy-cm')
+    assert user.height == 1.75
+    assert user.segment_key == 'adult|male|normal|moderate'
+    assert user.bmi == 22.86
+    assert 2500 < user_meal_targets(user)[0] * MEALS_PER_DAY < 2600
+    assert convert_legacy_heights() == 0
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app import db
+from models import Meal, MealHistory, User
+from query_plans import SAMPLE_USER_ID, check_query_plans
+
+SEED_USERS = 50
+SEED_HISTORY_PER_USER = 30
+
+
+def seed_history():
+    meal_ids = [meal_id for meal_id, in db.session.query(Meal.id)]
+    user_ids = [SAMPLE_USER_ID] + [f'plan-seed-{index}' for index in range(SEED_USERS)]
+    db.session.add_all(User(id=user_id) for user_id in user_ids)
+    now = datetime.now()
+    db.session.execute(MealHistory.__table__.insert(), [
+        {
+            'user_id': user_id,
+            'meal_id': meal_ids[index % len(meal_ids)],
+            'created_at': now - timedelta(hours=index),
+        }
+        for user_id in user_ids
+        for index in range(SEED_HISTORY_PER_USER)
+    ])
+    db.session.commit()
+    with db.engine.begin() as connection:
+        connection.execute(text('ANALYZE'))
+
+
+def test_hot_queries_use_indexes(app_context):
+    seed_history()
+    results = check_query_plans()
+    assert results
+    scans = {name: plan for name, (plan, sequential) in results.items() if sequential}
+    assert not scans, f'Hot queries without an index: {scans}'
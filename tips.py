@@ -0,0 +1,118 @@
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+
+from app import app, db
+from data_versions import version_registry
+from models import HealthTip
+
+Tip = namedtuple('Tip', 'id title content category target_demographic')
+
+# How much more likely a tip aimed at the user's health goal is to be picked
+GOAL_WEIGHT = 3.0
+
+
+class TipSet:
+    """Active health tips at one version, indexed by category and demographic"""
+
+    def __init__(self, version, tips):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.tips = tips
+        self.by_category = {}
+        self.by_demographic = {}
+        for tip in tips:
+            self.by_category.setdefault(tip.category, []).append(tip)
+            self.by_demographic.setdefault(tip.target_demographic, []).append(tip)
+
+        # Per (category or None, demographic): the tips of that pool aimed
+        # at the demographic, and the rest of the pool
+        self.targeted = {}
+        self.others = {}
+        pools = {None: tips, **self.by_category}
+        for demographic in self.by_demographic.keys() - {None}:
+            for category, pool in pools.items():
+                targeted = [tip for tip in pool if tip.target_demographic == demographic]
+                if targeted:
+                    self.targeted[category, demographic] = targeted
+                    self.others[category, demographic] = [
+                        tip for tip in pool if tip.target_demographic != demographic
+                    ]
+
+
+class TipService:
+    """In-memory sampler over active health tips.
+
+    Tips are reloaded after ``HEALTH_TIP_TTL_SECONDS`` or as soon as a
+    transaction touching health_tips commits, in this or another worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._tips = None
+        self.loads = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+    def current(self):
+        tips = self._tips
+        ttl = app.config.get('HEALTH_TIP_TTL_SECONDS', 3600)
+        if tips is None or tips.version != self._version or time.monotonic() - tips.loaded_at > ttl:
+            tips = self.reload()
+        return tips
+
+    def reload(self):
+        version = self._version
+        rows = db.session.query(
+            HealthTip.id,
+            HealthTip.title,
+            HealthTip.content,
+            HealthTip.category,
+            HealthTip.target_demographic,
+        ).filter(HealthTip.is_active.is_(True)).order_by(HealthTip.id).all()
+        tips = TipSet(version, [Tip(*row) for row in rows])
+        self._tips = tips
+        self.loads += 1
+        logging.info("Loaded %d health tips (version %d)", len(tips.tips), version)
+        return tips
+
+    def sample(self, k, health_goal=None, category=None):
+        """Pick up to ``k`` distinct tips, favouring ones aimed at ``health_goal``"""
+        tips = self.current()
+        pool = tips.by_category.get(category, []) if category else tips.tips
+        if len(pool) <= k:
+            return random.sample(pool, len(pool))
+
+        # Each targeted tip is GOAL_WEIGHT times as likely as any other one
+        key = (category or None, health_goal)
+        targeted = tips.targeted.get(key, []) if health_goal else []
+        others = tips.others[key] if targeted else pool
+        targeted_share = GOAL_WEIGHT * len(targeted) / (GOAL_WEIGHT * len(targeted) + len(others))
+
+        picked = []
+        seen = set()
+        attempts = 0
+        while len(picked) < k and attempts < k * 8:
+            attempts += 1
+            source = targeted if targeted and random.random() < targeted_share else others
+            tip = random.choice(source)
+            if tip.id not in seen:
+                seen.add(tip.id)
+                picked.append(tip)
+        if len(picked) < k:
+            picked.extend(random.sample([tip for tip in pool if tip.id not in seen], k - len(picked)))
+        return picked
+
+
+tip_service = TipService()
+
+
+# Reload tips once a transaction that touched them commits, here or in another worker
+@version_registry.on_change('tips')
+def _invalidate_on_change(ids):
+    tip_service.invalidate()